@@ -1,5 +1,7 @@
 import Logger # static import for logger setup
 from cogs.Referee import Referee
+from keep_alive import keep_alive
+from IRC.Metrics import metrics
 
 from discord.ext import commands
 
@@ -9,6 +11,10 @@ import json
 import logging
 
 configs = json.load(open("configs.json", "r"))
+# off by default, when on /metrics on the keep alive server serves them in the Prometheus format
+metrics.enabled = configs.get("metrics", False)
+# how much raw osu!irc traffic is logged: "all", "off", "sample:N" or "rate:N"
+Logger.configure_raw_lines(configs.get("raw_log", "all"))
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -25,10 +31,12 @@ async def on_ready():
 
 async def main():
     async with bot:
-        await bot.add_cog(Referee(bot, configs["nick"], configs["pass"], configs["irc_channel_id"]))
+        await bot.add_cog(Referee.from_configs(bot, configs))
         await bot.start(configs["token"])
 
 if __name__ == "__main__":
+    if metrics.enabled:
+        keep_alive() # only needed for /metrics when not hosted
     try:
         asyncio.run(main())
     except Exception as e:
@@ -0,0 +1,43 @@
+from collections import deque
+from enum import Enum
+from typing import Any, Callable
+
+class OverflowPolicy(Enum):
+    DROP_OLDEST = "drop_oldest" # silently forget the oldest lines
+    SUMMARISE   = "summarise"   # forget them, but say how many on the next drain
+
+class MessageBuffer:
+    '''
+        Bounded FIFO of staged lines. Draining swaps in an empty deque and hands
+        the old one over as is, nothing is copied. `notice` wraps the "[n messages
+        skipped]" text put in front when summarising into an entry.
+    '''
+    def __init__(
+        self,
+        capacity: int = 1000,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        notice: Callable[[str], Any] = str
+    ) -> None:
+        self.capacity             = capacity
+        self.policy               = policy
+        self.notice               = notice
+        self.messages: deque[Any] = deque()
+        self.skipped              = 0 # dropped since the last drain
+        self.dropped              = 0 # dropped in total
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def append(self, message: Any):
+        if len(self.messages) >= self.capacity:
+            self.messages.popleft()
+            self.skipped += 1
+            self.dropped += 1
+        self.messages.append(message)
+
+    def drain(self) -> deque[Any]:
+        messages, self.messages = self.messages, deque()
+        if self.skipped and self.policy is OverflowPolicy.SUMMARISE:
+            messages.appendleft(self.notice(f"[{self.skipped} messages skipped]"))
+        self.skipped = 0
+        return messages
@@ -0,0 +1,91 @@
+from queue import SimpleQueue
+from threading import Thread
+from typing import BinaryIO, Iterator
+
+import logging
+import struct
+import time
+
+# file header, followed by the nick the capture was taken as and a newline
+MAGIC  = b"osu!irc capture 1\n"
+# per socket read: microseconds since the previous read (saturating), payload length
+RECORD = struct.Struct("<II")
+MAX_DELTA = 0xFFFFFFFF
+
+class CaptureWriter:
+    '''
+        Appends every batch of lines `OsuSocket.recv` reads to a file, with the
+        monotonic time since the previous batch, for `benchmarks.replay`.
+
+        Payloads are the batch's lines joined by "\\n", lines never contain one.
+        On the IRC loop a batch costs one encode and one struct pack into a
+        buffer, the buffer is written by a background thread once it holds
+        `chunk_size` bytes or every `flush_interval` seconds.
+    '''
+    def __init__(self, path: str, nick: str, chunk_size: int = 256 * 1024, flush_interval: float = 1) -> None:
+        self.logger                            = logging.getLogger('OsuSocket')
+        self.path                              = path
+        self.chunk_size                        = chunk_size
+        self.flush_interval                    = int(flush_interval * 1e9)
+        self.buffer                            = bytearray()
+        self.queue: SimpleQueue[bytes | None]  = SimpleQueue()
+        self.last                              = time.monotonic_ns()
+        self.flushed                           = self.last
+        self.batches                           = 0
+        # appended to, a restart doesn't lose the previous capture
+        self.file                              = open(path, "ab")
+        if self.file.tell() == 0:
+            self.buffer += MAGIC + nick.encode("utf-8") + b"\n"
+        self.thread                            = Thread(target=self._run, name="capture", daemon=True)
+        self.thread.start()
+
+    def write(self, lines: list[str]):
+        if not lines: return
+        now = time.monotonic_ns()
+        payload = "\n".join(lines).encode("utf-8")
+        self.buffer += RECORD.pack(min((now - self.last) // 1000, MAX_DELTA), len(payload))
+        self.buffer += payload
+        self.last = now
+        self.batches += 1
+        if len(self.buffer) >= self.chunk_size or now - self.flushed >= self.flush_interval:
+            self.flush(now)
+
+    def flush(self, now: int | None = None):
+        if self.buffer:
+            self.queue.put(bytes(self.buffer))
+            self.buffer.clear()
+        self.flushed = now or time.monotonic_ns()
+
+    def close(self, timeout: float | None = 5):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        try:
+            while (chunk := self.queue.get()) is not None:
+                self.file.write(chunk)
+                self.file.flush()
+        except OSError as e:
+            self.logger.exception(f"Capture to {self.path} stopped: {e}")
+        finally:
+            self.file.close()
+
+def read_capture(fp: BinaryIO) -> tuple[str, Iterator[tuple[float, list[str]]]]:
+    '''
+        Returns the nick the capture was taken as and an iterator over its
+        batches, (seconds since the previous batch, lines).
+    '''
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not an osu!irc capture")
+    nick = fp.readline().rstrip(b"\n").decode("utf-8")
+
+    def batches() -> Iterator[tuple[float, list[str]]]:
+        while len(header := fp.read(RECORD.size)) == RECORD.size:
+            delta, length = RECORD.unpack(header)
+            payload = fp.read(length)
+            if len(payload) < length:
+                return # cut short, e.g. the bot was killed mid write
+            yield delta / 1e6, payload.decode("utf-8", "replace").split("\n")
+
+    return nick, batches()
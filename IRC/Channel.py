@@ -1,20 +1,42 @@
 from typing import Any
 from datetime import datetime
+from .Parser import ParsedMessage
+from .Matcher import PatternMatcher
+from .Waiters import WaiterRegistry
+from .Buffer import MessageBuffer, OverflowPolicy
+from .Lobby import LobbyState, LOBBY_EVENTS
+from collections import deque
 
-import re
 import asyncio
 
+# (time, sender, text) of a line waiting to be relayed, formatted only by whoever delivers it
+StagedLine = tuple[str, str, str]
+
+def format_line(line: StagedLine) -> str:
+    time, sender, text = line
+    return f"[{time}] {sender}: {text}" if sender else f"[{time}] {text}"
+
+def notice(text: str) -> StagedLine:
+    return (datetime.now().strftime("%H:%M:%S"), "", text)
+
 class Channel:
-    def __init__(self, name: str) -> None:
+    # BanchoBot events shared by every channel, actions are called as action(channel, *groups)
+    events = PatternMatcher()
+
+    def __init__(
+        self,
+        name: str,
+        buffer_size: int = 1000,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+    ) -> None:
         self.name                                = name
+        self.id                                  = 0 # set by resolve_chat_type for lobbies
         self.type                                = self.resolve_chat_type(name)
-        self.id                                  = 0
+        self.topic                               = ""
         self.users:    set[str]                  = set()
-        self.staged_messages: list[str]          = []
-        self.patterns: dict[str, Any]            = {
-            r"BanchoBot : (.*) joined in slot \\d.": self.add_user,
-            r"BanchoBot : (.*) left the game.": self.remove_user,
-        }
+        self.staged_messages                     = MessageBuffer(buffer_size, overflow_policy, notice)
+        self.waiters                             = WaiterRegistry()
+        self.lobby                               = LobbyState(self.id) if self.type == "lobby" else None
     
     def resolve_chat_type(self, name: str):
         if name.startswith("#mp_"):
@@ -33,51 +55,35 @@ class Channel:
             return 1
         return 0
 
-    def update(self, data: list[str]):
-        current_time = datetime.now().strftime("%H:%M:%S")
-        message = "[%s] %s: %s" % (current_time, data[2], data[3])
+    def update(self, data: ParsedMessage):
+        self.staged_messages.append((datetime.now().strftime("%H:%M:%S"), data.sender, data.text))
 
-        self.staged_messages.append(message)
+        if self.waiters:
+            self.waiters.dispatch(data.text)
 
-        if hasattr(self, '_match_event'):
-            _match_event, _pattern = self._match_event
-            found = re.search(_pattern, message)
+        # only BanchoBot reports lobby events, skip the regex for everyone else
+        if data.sender == "BanchoBot":
+            found = Channel.events.match(data.text)
             if found:
-                _match_event.set()
-                self._match_result = found.groups()
-
-        for pattern, action in self.patterns.items():
-            found = re.search(pattern, message)
-            if found:
-                action(found.group(1))
-                return
+                action, groups = found
+                action(self, *groups)
     
-    def get_staged_messages(self) -> list[str]:
-        messages = self.staged_messages.copy()
-        self.staged_messages = []
-        return messages
+    def get_staged_messages(self) -> deque[StagedLine]:
+        return self.staged_messages.drain()
     
-    async def listen_for_pattern(self, pattern: str) -> tuple[str | Any, ...]:
-        match_event = asyncio.Event()
-        self._match_event = (match_event, pattern)
-        try:
-            _, pending = await asyncio.wait(
-                [
-                    asyncio.create_task(match_event.wait())
-                ],
-                return_when = asyncio.FIRST_COMPLETED,
-                timeout = 10
-            )
-            for task in pending:
-                task.cancel()
+    def expect(self, pattern: str, key: str | None = None) -> asyncio.Future:
+        return self.waiters.expect(pattern, key)
+
+    async def listen_for_pattern(
+        self,
+        pattern: str,
+        key: str | None = None,
+        timeout: float | None = 10,
+        future: asyncio.Future | None = None
+    ) -> tuple[str | Any, ...]:
+        if future is None:
+            future = self.expect(pattern, key)
+        return await self.waiters.wait(pattern, future, key, timeout)
 
-            if not match_event.is_set():
-                return tuple()
-            
-            if hasattr(self, '_match_result'):
-                return self._match_result
-            return tuple()
-        finally:
-            del self._match_event
-            if hasattr(self, '_match_result'):
-                del self._match_result
\ No newline at end of file
+for name, pattern, action in LOBBY_EVENTS:
+    Channel.events.register(name, pattern, action)
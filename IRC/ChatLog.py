@@ -0,0 +1,235 @@
+from datetime import datetime
+from queue import Empty, SimpleQueue
+from threading import Event, Thread
+from typing import IO, Iterator
+
+import logging
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id      INTEGER PRIMARY KEY,
+    channel TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    sender  TEXT NOT NULL,
+    text    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel_ts ON messages (channel, ts);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts);
+"""
+
+# external content index over messages, kept in sync by triggers so it never stores the text twice
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE messages_fts USING fts5 (sender, text, content = 'messages', content_rowid = 'id');
+CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, sender, text) VALUES (new.id, new.sender, new.text);
+END;
+CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, sender, text) VALUES ('delete', old.id, old.sender, old.text);
+END;
+INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');
+"""
+
+def to_match_query(query: str) -> str:
+    # every word as a quoted string, so user input can't trip over FTS5 query syntax
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+class ChatLog:
+    '''
+        Append only store of every chat line, SQLite in WAL mode.
+
+        `append` only puts the line on a queue, a writer thread commits whatever
+        has piled up in one transaction, so the IRC loop never touches the disk.
+        Lines older than `retention_days` are deleted periodically and the freed
+        pages handed back to the file system.
+    '''
+    def __init__(
+        self,
+        path: str = "chatlog.db",
+        retention_days: float | None = 30,
+        batch_size: int = 1000,
+        flush_interval: float = 0.5,
+        prune_interval: float = 3600
+    ) -> None:
+        self.path                                         = path
+        self.retention_days                               = retention_days
+        self.batch_size                                   = batch_size
+        self.flush_interval                               = flush_interval
+        self.prune_interval                               = prune_interval
+        self.logger                                       = logging.getLogger('ChatLog')
+        self.queue: SimpleQueue[tuple | Event | None]     = SimpleQueue()
+        self.searchable                                   = False
+        self.written                                      = 0
+        self._writer: Thread | None                       = None
+
+        # must be set before the first table is created, and before switching to WAL which
+        # writes the header of a new database, to take effect
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # a database created before that, only a VACUUM changes it, once
+            self.logger.info(f"Rebuilding {path} to hand pruned space back to the file system")
+            conn.execute("VACUUM")
+        conn.close()
+
+        conn = self.connect()
+        conn.executescript(SCHEMA)
+        self.searchable = self._create_search_index(conn)
+        conn.close()
+
+    def _create_search_index(self, conn: sqlite3.Connection) -> bool:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).fetchone()
+        if exists: return True
+        try:
+            with conn:
+                conn.executescript("BEGIN;" + SEARCH_SCHEMA + "COMMIT;")
+            return True
+        except sqlite3.OperationalError as e:
+            self.logger.warning(f"Full text search is unavailable, this sqlite has no FTS5: {e}")
+            return False
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def start(self):
+        if self._writer: return
+        self._writer = Thread(target=self._run, name="ChatLog", daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        if not self._writer: return
+        self.queue.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def append(self, channel: str, sender: str, text: str, ts: float | None = None):
+        self.queue.put((channel, ts or time.time(), sender, text))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        '''
+            Blocks until every line appended so far is committed.
+        '''
+        if not self._writer: return False
+        done = Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        conn = self.connect()
+        next_prune = time.monotonic()
+        running = True
+        while running:
+            batch: list[tuple] = []
+            waiters: list[Event] = []
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+                while True:
+                    if item is None:
+                        running = False
+                        break
+                    if isinstance(item, Event):
+                        waiters.append(item)
+                    else:
+                        batch.append(item)
+                        if len(batch) >= self.batch_size:
+                            break
+                    item = self.queue.get_nowait()
+            except Empty:
+                pass
+
+            if batch:
+                try:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO messages (channel, ts, sender, text) VALUES (?, ?, ?, ?)",
+                            batch
+                        )
+                    self.written += len(batch)
+                except sqlite3.Error as e:
+                    self.logger.error(f"Failed to write {len(batch)} lines: {e}")
+            for waiter in waiters:
+                waiter.set()
+
+            if self.retention_days and time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + self.prune_interval
+                self._prune(conn)
+        conn.close()
+
+    def _prune(self, conn: sqlite3.Connection):
+        cutoff = time.time() - self.retention_days * 86400
+        try:
+            with conn:
+                deleted = conn.execute("DELETE FROM messages WHERE ts < ?", (cutoff,)).rowcount
+            if deleted:
+                # frees a page per step, `execute` stops after the first one
+                conn.executescript("PRAGMA incremental_vacuum")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self.logger.info(f"Pruned {deleted} lines older than {self.retention_days} days")
+        except sqlite3.Error as e:
+            self.logger.error(f"Failed to prune chat log: {e}")
+
+    def iter_channel(self, channel: str, since: float | None = None) -> Iterator[tuple[float, str, str]]:
+        '''
+            (ts, sender, text) for every stored line of `channel`, oldest first.
+            Opens its own connection, WAL lets it read while the writer commits.
+        '''
+        conn = self.connect()
+        try:
+            yield from conn.execute(
+                "SELECT ts, sender, text FROM messages WHERE channel = ? AND ts >= ? ORDER BY ts, id",
+                (channel, since or 0)
+            )
+        finally:
+            conn.close()
+
+    def export(self, channel: str, fp: IO[str]) -> int:
+        count = 0
+        for ts, sender, text in self.iter_channel(channel):
+            fp.write(f"[{datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')}] {sender}: {text}\n")
+            count += 1
+        return count
+
+    def search(
+        self,
+        query: str,
+        channel: str | None = None,
+        sender: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = 20
+    ) -> list[tuple[str, float, str, str]]:
+        '''
+            (channel, ts, sender, text) of the newest lines containing every word of `query`.
+        '''
+        if not self.searchable: return []
+        match = to_match_query(query)
+        if not match: return []
+
+        sql = "SELECT m.channel, m.ts, m.sender, m.text FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid WHERE messages_fts MATCH ?"
+        params: list = [match]
+        if channel:
+            sql += " AND m.channel = ?"
+            params.append(channel)
+        if sender:
+            sql += " AND m.sender = ?"
+            params.append(sender)
+        if since:
+            sql += " AND m.ts >= ?"
+            params.append(since)
+        if until:
+            sql += " AND m.ts < ?"
+            params.append(until)
+        sql += " ORDER BY m.id DESC LIMIT ?"
+        params.append(limit)
+
+        conn = self.connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
@@ -0,0 +1,150 @@
+from collections import deque
+
+import asyncio
+
+class LineFramer:
+    '''
+        Splits a byte stream into lines without decoding partial data.
+
+        Data is received straight into a preallocated buffer (see `get_buffer`),
+        line boundaries are searched on bytes and only complete lines are
+        decoded, so a multibyte character split between two reads is never
+        cut in half.
+    '''
+    def __init__(self, size: int = 64 * 1024, min_free: int = 4096) -> None:
+        self.buffer   = bytearray(size)
+        self.view     = memoryview(self.buffer)
+        self.min_free = min_free
+        self.start    = 0 # first byte of the current partial line
+        self.end      = 0 # end of valid data
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif len(self.buffer) - self.end < self.min_free:
+            remain = self.end - self.start
+            if remain + self.min_free > len(self.buffer):
+                # a single line longer than the buffer, grow it
+                buffer = bytearray(max(len(self.buffer) * 2, remain + self.min_free))
+                buffer[:remain] = self.buffer[self.start:self.end]
+                self.buffer = buffer
+                self.view   = memoryview(self.buffer)
+            else:
+                self.buffer[:remain] = self.buffer[self.start:self.end]
+            self.start = 0
+            self.end   = remain
+        return self.view[self.end:]
+
+    def buffer_updated(self, nbytes: int) -> list[str]:
+        end = self.end + nbytes
+        last = self.buffer.rfind(b"\n", self.end, end)
+        self.end = end
+        if last == -1:
+            return []
+
+        # decode every complete line at once, the region ends on a line boundary
+        text = self.buffer[self.start:last + 1].decode("utf-8", "replace")
+        self.start = last + 1
+        lines = text.split("\r\n")
+        if len(lines) - 1 != text.count("\n"):
+            # not (only) CRLF terminated
+            lines = text.replace("\r\n", "\n").split("\n")
+        lines.pop()
+        return lines
+
+    def feed(self, data: bytes) -> list[str]:
+        lines: list[str] = []
+        data = memoryview(data)
+        while data:
+            buffer = self.get_buffer(len(data))
+            n = min(len(buffer), len(data))
+            buffer[:n] = data[:n]
+            lines += self.buffer_updated(n)
+            data = data[n:]
+        return lines
+
+class LineProtocol(asyncio.BufferedProtocol):
+    '''
+        Buffered protocol feeding a `LineFramer`, the transport reads directly
+        into the framer's buffer (recv_into) instead of allocating a new
+        bytes object for every chunk.
+    '''
+    def __init__(self, max_pending: int = 4096) -> None:
+        self.framer                                = LineFramer()
+        self.lines: deque[str]                     = deque()
+        self.max_pending                           = max_pending
+        self.transport: asyncio.Transport | None   = None
+        self._waiter: asyncio.Future | None        = None
+        self._drain_waiter: asyncio.Future | None  = None
+        self._reading_paused                       = False
+        self._closed                               = False
+
+    def _wakeup(self, waiter: asyncio.Future | None):
+        if waiter and not waiter.done():
+            waiter.set_result(None)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self._closed = True
+        self._wakeup(self._waiter)
+        self._wakeup(self._drain_waiter)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.framer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int):
+        lines = self.framer.buffer_updated(nbytes)
+        if not lines: return
+        self.lines.extend(lines)
+        if len(self.lines) > self.max_pending and self.transport and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+        self._wakeup(self._waiter)
+
+    def eof_received(self) -> bool:
+        self._closed = True
+        self._wakeup(self._waiter)
+        return False
+
+    def pause_writing(self):
+        if self._drain_waiter is None or self._drain_waiter.done():
+            self._drain_waiter = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        self._wakeup(self._drain_waiter)
+
+    async def read_lines(self) -> deque[str]:
+        while not self.lines:
+            if self._closed:
+                raise ConnectionResetError("connection closed by server")
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+        lines, self.lines = self.lines, deque()
+        if self._reading_paused and self.transport:
+            self._reading_paused = False
+            self.transport.resume_reading()
+        return lines
+
+    def write(self, data: bytes):
+        if self._closed or not self.transport:
+            raise ConnectionResetError("connection closed")
+        self.transport.write(data)
+
+    async def drain(self):
+        if self._closed:
+            raise ConnectionResetError("connection closed")
+        if self._drain_waiter and not self._drain_waiter.done():
+            await self._drain_waiter
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
@@ -1,14 +1,30 @@
 from collections import defaultdict
 from .Channel import Channel
-from typing import Any
+from .Buffer import OverflowPolicy
+from .ChatLog import ChatLog
+from .Parser import ParsedMessage, MESSAGE, JOIN, NAMES, PART, QUIT, TOPIC
+from typing import Any, Callable
 
 import logging
 class IrcManager:
-    def __init__(self):
+    '''
+        Chats and their state for a single connection, every OsuSocket has its own.
+    '''
+    def __init__(
+        self,
+        buffer_size: int = 1000,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        chat_log: ChatLog | None = None
+    ):
         self.logger                        = logging.getLogger('IrcManager')
         self.chat_list: dict[str, Channel] = defaultdict()
         self.nick                          = ""
         self.passw                         = ""
+        self.buffer_size                   = buffer_size
+        self.overflow_policy               = overflow_policy
+        self.chat_log                      = chat_log
+        # keyed by chat name so they survive the chat being recreated on reconnect
+        self.listeners: dict[str, Callable[[Channel], None]] = {}
 
     def clear(self):
         self.chat_list = {}
@@ -23,40 +39,70 @@ class IrcManager:
 
     def add_chat(self, name: str):
         if not self.chat_list.get(name):
-            self.chat_list[name] = Channel(name)
+            self.chat_list[name] = Channel(name, self.buffer_size, self.overflow_policy)
+
+    def subscribe(self, name: str, listener: Callable[[Channel], None]):
+        '''
+            `listener` is called (on the IRC loop) every time a message is staged in chat `name`.
+        '''
+        self.listeners[name] = listener
+
+    def unsubscribe(self, name: str):
+        self.listeners.pop(name, None)
 
     def remove_chat(self, name: str):
         if self.chat_list.get(name):
             del self.chat_list[name]
 
-    def update(self, data: list[str]):
-        name = data[1]
+    def update(self, message: ParsedMessage):
+        name = message.channel
+        # `is` against the plain kind globals, a `match` on MessageKind members is several times slower
+        kind = message.kind
         try:
-            match (data[0]):
-                case "0": # join
-                    if data[2] == self.nick:
-                        self.add_chat(name)
-                    self.chat_list[name].add_user(data[2:len(data)])
-
-                case "1": # message
-                    if name == self.nick:
-                        name = data[2]
-                    if not self.chat_list.get(name):
-                        self.add_chat(name)
-                    self.chat_list[name].update(data)
-
-                case "2": # leave
-                    if data[2] == self.nick:
-                        self.remove_chat(name)
-                    else:
-                        self.chat_list[name].remove_user(data[2])
+            if kind is MESSAGE:
+                if name == self.nick:
+                    name = message.sender
+                if not self.chat_list.get(name):
+                    self.add_chat(name)
+                chat = self.chat_list[name]
+                chat.update(message)
+                if self.chat_log:
+                    self.chat_log.append(name, message.sender, message.text)
+                listener = self.listeners.get(name)
+                if listener:
+                    listener(chat)
+
+            elif kind is JOIN:
+                if message.sender == self.nick:
+                    self.add_chat(name)
+                self.chat_list[name].add_user([message.sender])
+
+            elif kind is NAMES:
+                self.chat_list[name].add_user(message.names)
+
+            elif kind is PART:
+                if message.sender == self.nick:
+                    self.remove_chat(name)
+                else:
+                    self.chat_list[name].remove_user(message.sender)
+
+            elif kind is QUIT:
+                for chat in self.chat_list.values():
+                    chat.remove_user(message.sender)
+
+            elif kind is TOPIC:
+                self.chat_list[name].topic = message.text
         except Exception as e:
             self.logger.error(e, exc_info=True)
 
-    async def listen_for_pattern(self, chat_name: str, pattern: str) -> tuple[str | Any, ...]:
+    async def listen_for_pattern(
+        self,
+        chat_name: str,
+        pattern: str,
+        key: str | None = None,
+        timeout: float | None = 10
+    ) -> tuple[str | Any, ...]:
         chat = self.get_chat(chat_name)
         if not chat:
             return tuple()
-        return await chat.listen_for_pattern(pattern)
-
-ircManager = IrcManager()
\ No newline at end of file
+        return await chat.listen_for_pattern(pattern, key, timeout)
@@ -0,0 +1,224 @@
+from datetime import datetime
+from typing import Any, Callable
+
+class Player:
+    __slots__ = ("name", "slot", "team", "ready", "host", "score", "passed")
+
+    def __init__(self, name: str, slot: int, team: str = "") -> None:
+        self.name                = name
+        self.slot                = slot
+        self.team                = team
+        self.ready               = False
+        self.host                = False
+        self.score: int | None   = None
+        self.passed: bool | None = None
+
+class LobbyState:
+    '''
+        What a referee would otherwise learn from `!mp settings`, kept up to
+        date from BanchoBot's lines as they arrive. Nothing is ever sent to
+        Bancho, `!mp settings` output that does show up is used to resync.
+    '''
+    def __init__(self, id: int) -> None:
+        self.id                         = id
+        self.room                       = ""
+        self.status                     = "idle" # idle, playing, closed
+        self.beatmap                    = ""
+        self.beatmap_id: int | None     = None
+        self.team_mode                  = ""
+        self.win_condition              = ""
+        self.mods                       = ""
+        self.freemod                    = False
+        self.all_ready                  = False
+        self.games                      = 0
+        self.slots: dict[int, Player]   = {}
+        self.players: dict[str, Player] = {}
+        self.updated                    = datetime.now()
+
+    def touch(self):
+        self.updated = datetime.now()
+
+    def player(self, name: str) -> (Player | None):
+        return self.players.get(name)
+
+    def place(self, name: str, slot: int, team: str = "") -> Player:
+        player = self.players.get(name)
+        if player:
+            if self.slots.get(player.slot) is player:
+                del self.slots[player.slot]
+            player.slot = slot
+            if team: player.team = team
+        else:
+            player = self.players[name] = Player(name, slot, team)
+        self.slots[slot] = player
+        self.all_ready = False
+        self.touch()
+        return player
+
+    def remove(self, name: str):
+        player = self.players.pop(name, None)
+        if player and self.slots.get(player.slot) is player:
+            del self.slots[player.slot]
+        self.all_ready = False
+        self.touch()
+
+    def set_host(self, name: str | None):
+        for player in self.players.values():
+            player.host = player.name == name
+        self.touch()
+
+    def set_beatmap(self, beatmap_id: str, title: str):
+        self.beatmap_id = int(beatmap_id)
+        self.beatmap = title.strip()
+        # bancho resets everyone's ready state on a map change
+        self.all_ready = False
+        for player in self.players.values():
+            player.ready = False
+        self.touch()
+
+    def start(self):
+        self.status = "playing"
+        self.all_ready = False
+        for player in self.players.values():
+            player.score = None
+            player.passed = None
+            player.ready = False
+        self.touch()
+
+    def summary(self) -> list[str]:
+        lines = [f"**{self.room or f'#mp_{self.id}'}** ({self.status}), https://osu.ppy.sh/mp/{self.id}"]
+        if self.beatmap_id:
+            lines.append(f"Beatmap: {self.beatmap} <https://osu.ppy.sh/b/{self.beatmap_id}>")
+        if self.team_mode or self.win_condition:
+            lines.append(f"Team mode: {self.team_mode or '?'}, win condition: {self.win_condition or '?'}")
+        mods = self.mods or "None"
+        lines.append(f"Mods: {mods}{', FreeMod' if self.freemod else ''}")
+        lines.append(f"Players: {len(self.players)}{', all ready' if self.all_ready else ''}, games played: {self.games}")
+        for slot in sorted(self.slots):
+            player = self.slots[slot]
+            flags = [flag for flag in (
+                "host" if player.host else "",
+                f"team {player.team}" if player.team else "",
+                "ready" if player.ready else "",
+            ) if flag]
+            line = f"`{slot:>2}` {player.name}"
+            if flags:
+                line += f" ({', '.join(flags)})"
+            if player.score is not None:
+                line += f" score {player.score:,} {'PASSED' if player.passed else 'FAILED'}"
+            lines.append(line)
+        return lines
+
+# BanchoBot lines -> handler(chat, *groups), registered on `Channel.events`. Anchored
+# at the start of the line, no named groups (see `PatternMatcher`)
+def _lobby(handler: Callable[..., Any]) -> Callable[..., Any]:
+    # the handlers only apply to #mp_ channels
+    def action(chat, *groups):
+        if chat.lobby is not None:
+            handler(chat.lobby, *groups)
+    return action
+
+def _joined(chat, name: str, slot: str, team: str | None):
+    chat.add_user([name])
+    if chat.lobby is not None:
+        chat.lobby.place(name, int(slot), (team or "").capitalize())
+
+def _left(chat, name: str):
+    chat.remove_user(name)
+    if chat.lobby is not None:
+        chat.lobby.remove(name)
+
+def _team(lobby: LobbyState, name: str, team: str):
+    player = lobby.player(name)
+    if player:
+        player.team = team
+        lobby.touch()
+
+def _all_ready(lobby: LobbyState):
+    lobby.all_ready = True
+    for player in lobby.players.values():
+        player.ready = True
+    lobby.touch()
+
+def _finished(lobby: LobbyState):
+    lobby.status = "idle"
+    lobby.games += 1
+    lobby.touch()
+
+def _aborted(lobby: LobbyState):
+    lobby.status = "idle"
+    lobby.touch()
+
+def _closed(lobby: LobbyState):
+    lobby.status = "closed"
+    lobby.touch()
+
+def _score(lobby: LobbyState, name: str, score: str, result: str):
+    player = lobby.player(name)
+    if player:
+        player.score = int(score)
+        player.passed = result == "PASSED"
+        lobby.touch()
+
+def _mods(lobby: LobbyState, mods: str, freemod: str):
+    lobby.mods = "" if mods == "all mods" else mods
+    lobby.freemod = freemod == "enabled"
+    lobby.touch()
+
+def _room(lobby: LobbyState, room: str):
+    lobby.room = room
+    lobby.touch()
+
+def _settings_mode(lobby: LobbyState, team_mode: str, win_condition: str):
+    lobby.team_mode = team_mode
+    lobby.win_condition = win_condition
+    lobby.touch()
+
+def _settings_mods(lobby: LobbyState, mods: str):
+    lobby.freemod = "Freemod" in mods
+    lobby.mods = ", ".join(mod.strip() for mod in mods.split(",") if mod.strip() not in ("Freemod", "None"))
+    lobby.touch()
+
+def _settings_slot(chat, slot: str, state: str, name: str, flags: str | None):
+    name = name.strip()
+    # in the lobby from before we joined, no "joined in slot" line announced them
+    chat.add_user([name])
+    if chat.lobby is None: return
+    team = ""
+    host = False
+    for flag in (flags or "").split("/"):
+        flag = flag.strip()
+        if flag.startswith("Team "):
+            team = flag[5:]
+        elif flag == "Host":
+            host = True
+    player = chat.lobby.place(name, int(slot), team)
+    player.ready = state == "Ready"
+    player.host = host
+
+LOBBY_EVENTS: list[tuple[str, str, Callable[..., Any]]] = [
+    ("joined",         r"(.+) joined in slot (\d+)(?: for team (red|blue))?\.$", _joined),
+    ("left",           r"(.+) left the game\.$", _left),
+    ("moved",          r"(.+) moved to slot (\d+)$", _lobby(lambda lobby, name, slot: lobby.place(name, int(slot)))),
+    ("team",           r"(.+) changed to (Red|Blue)$", _lobby(_team)),
+    ("host",           r"(.+) became the host\.$", _lobby(lambda lobby, name: lobby.set_host(name))),
+    ("host_changed",   r"Changed match host to (.+)$", _lobby(lambda lobby, name: lobby.set_host(name))),
+    ("host_cleared",   r"Cleared match host$", _lobby(lambda lobby: lobby.set_host(None))),
+    ("all_ready",      r"All players are ready$", _lobby(_all_ready)),
+    ("started",        r"The match has started!$", _lobby(LobbyState.start)),
+    ("finished",       r"The match has finished!$", _lobby(_finished)),
+    ("aborted",        r"Aborted the match$", _lobby(_aborted)),
+    ("closed",         r"Closed the match$", _lobby(_closed)),
+    ("score",          r"(.+) finished playing \(Score: (\d+), (PASSED|FAILED)\)\.$", _lobby(_score)),
+    ("beatmap",        r"Beatmap changed to: (.+) \(https://osu\.ppy\.sh/b/(\d+)\)$",
+                           _lobby(lambda lobby, title, id: lobby.set_beatmap(id, title))),
+    ("map_set",        r"Changed beatmap to https://osu\.ppy\.sh/b/(\d+) (.+)$", _lobby(LobbyState.set_beatmap)),
+    ("mods",           r"(?:Enabled|Disabled) (.+?), (enabled|disabled) FreeMod$", _lobby(_mods)),
+    # `!mp settings` output
+    ("settings_room",  r"Room name: (.+), History: https://osu\.ppy\.sh/mp/\d+$", _lobby(_room)),
+    ("settings_map",   r"Beatmap: https://osu\.ppy\.sh/b/(\d+) (.+)$", _lobby(LobbyState.set_beatmap)),
+    ("settings_mode",  r"Team mode: (\w+), Win condition: (\w+)$", _lobby(_settings_mode)),
+    ("settings_mods",  r"Active mods: (.+)$", _lobby(_settings_mods)),
+    ("settings_slot",  r"Slot (\d+) +(Ready|Not Ready|No Map) +https://osu\.ppy\.sh/u/\d+ (.+?) *(?:\[(.+)\])?$",
+                           _settings_slot),
+]
@@ -0,0 +1,51 @@
+from typing import Any, Callable
+
+import re
+
+class PatternMatcher:
+    '''
+        A set of regexes compiled into a single alternation, so a line is
+        scanned once no matter how many patterns are registered.
+
+        Every pattern is wrapped in its own group, `match` uses the index of
+        that group to find which pattern matched and hands its inner groups
+        to the registered action. Patterns are anchored at the start of the
+        line and must not use named groups.
+    '''
+    def __init__(self) -> None:
+        self.patterns: dict[str, tuple[str, Callable[..., Any]]]          = {}
+        self._compiled: re.Pattern | None                                 = None
+        self._groups: dict[int, tuple[int, Callable[..., Any]]]           = {}
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def register(self, name: str, pattern: str, action: Callable[..., Any]):
+        self.patterns[name] = (pattern, action)
+        # compile here rather than lazily so the matching path never has to
+        self._compile()
+
+    def unregister(self, name: str):
+        if self.patterns.pop(name, None):
+            self._compile()
+
+    def _compile(self):
+        parts: list[str] = []
+        groups: dict[int, tuple[int, Callable[..., Any]]] = {}
+        index = 1
+        for pattern, action in self.patterns.values():
+            inner = re.compile(pattern).groups
+            parts.append(f"({pattern})")
+            groups[index] = (inner, action)
+            index += inner + 1
+        self._compiled = re.compile("|".join(parts)) if parts else None
+        self._groups = groups
+
+    def match(self, text: str) -> (tuple[Callable[..., Any], tuple[str | Any, ...]] | None):
+        if not self._compiled: return None
+        found = self._compiled.match(text)
+        if not found: return None
+        # the wrapping group closes last, so it is always `lastindex`
+        index = found.lastindex
+        inner, action = self._groups[index]
+        return action, found.groups()[index:index + inner]
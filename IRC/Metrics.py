@@ -0,0 +1,126 @@
+from bisect import bisect_left
+from typing import Callable
+
+# seconds, from a microsecond (parsing a line) to tens of seconds (a rate limited discord send)
+LATENCY_BUCKETS = (
+    0.000001, 0.000005, 0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005,
+    0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30
+)
+SIZE_BUCKETS    = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+class Counter:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name  = name
+        self.help  = help
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {self.value}"
+        ]
+
+class Histogram:
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name    = name
+        self.help    = help
+        self.buckets = buckets
+        self.counts  = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.sum     = 0.0
+        self.count   = 0
+
+    def observe(self, value: float):
+        # per bucket counts, made cumulative only when rendered
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {total}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+class Gauge:
+    '''
+        Read from `read` only when scraped, so it costs nothing in between.
+        `read` returns a value, or {label value: value} when `label` is set.
+    '''
+    __slots__ = ("name", "help", "read", "label")
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], float | dict[str, float]],
+        label: str | None = None
+    ) -> None:
+        self.name  = name
+        self.help  = help
+        self.read  = read
+        self.label = label
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        value = self.read()
+        if isinstance(value, dict):
+            for label, item in value.items():
+                lines.append(f'{self.name}{{{self.label}="{label}"}} {item}')
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+class Metrics:
+    '''
+        Counters and histograms for the relay pipeline, rendered in the
+        Prometheus text format.
+
+        Instrumented code checks `enabled` first, so with metrics off a line
+        only pays for one attribute lookup.
+    '''
+    def __init__(self) -> None:
+        self.enabled                                          = False
+        self.metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(name, lambda: Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(name, lambda: Histogram(name, help, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], float | dict[str, float]],
+        label: str | None = None
+    ) -> Gauge:
+        gauge = self.metrics[name] = Gauge(name, help, read, label)
+        return gauge
+
+    def _get(self, name: str, create: Callable[[], Counter | Histogram]):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = create()
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in list(self.metrics.values()):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
@@ -1,34 +1,123 @@
-from time import sleep
+from collections import deque
+from concurrent.futures import Future
+from enum import Enum
+from typing import Any, Callable, Coroutine, Iterable
 
 from . import Utils
-from .IrcManager import ircManager
-from .Parser import parse
+from .IrcManager import IrcManager
+from .Parser import parse, MessageKind
 from .Exceptions import ConnectionError, OsuCredentialsIncorrect, NoSuchChannel
-from .Channel import Channel
+from .Channel import Channel, StagedLine
+from .SendQueue import SendQueue, Priority
+from .Framer import LineProtocol
+from .Metrics import metrics, SIZE_BUCKETS
+from .Capture import CaptureWriter
 
-import socket
 import asyncio
+import functools
 import logging
+import random
+import time
+
+def on_irc_loop(method: Callable[..., Coroutine[Any, Any, Any]]):
+    '''
+        Run the decorated coroutine on the IRC event loop, even if it is awaited
+        from another loop (e.g. the discord bot), since the stream transport
+        belongs to the loop that opened it. Free when both are the same loop.
+    '''
+    @functools.wraps(method)
+    async def wrapper(self: "OsuSocket", *args, **kwargs):
+        coro = method(self, *args, **kwargs)
+        loop = self.loop
+        if loop is None or loop is asyncio.get_running_loop():
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+    return wrapper
+
+DEFAULT_HOST    = "irc.ppy.sh"
+DEFAULT_PORT    = 6667
+# keep JOIN lines well under the 512 byte IRC line limit
+JOIN_LINE_LIMIT = 400
+# messages kept while disconnected, the oldest are dropped past this
+REPLAY_LIMIT    = 500
+# reconnect backoff in seconds, the first retry is immediate
+BACKOFF_BASE    = 0.5
+BACKOFF_MAX     = 30
+
+LINES_READ   = metrics.counter("osu_irc_lines_read_total", "Lines read from osu!irc")
+READ_BATCH   = metrics.histogram("osu_irc_read_batch_lines", "Lines handed over by a single socket read", SIZE_BUCKETS)
+PARSE_TIME   = metrics.histogram("osu_irc_parse_seconds", "Time to parse a line")
+UPDATE_TIME  = metrics.histogram("osu_irc_update_seconds", "Time for IrcManager.update, including staging the line")
+
+class ConnectionState(Enum):
+    DISCONNECTED   = 0
+    CONNECTING     = 1
+    AUTHENTICATING = 2
+    READY          = 3
+    BACKOFF        = 4
 
 class OsuSocket:
-    def __init__(self) -> None:
-        self.socket                       = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.logger                       = logging.getLogger('OsuSocket')
-        self.threadLoop                   = Utils.ThreadLoop()
-        self._stop_event                  = asyncio.Event()
-        self._pending_messages: list[str] = []
+    def __init__(
+        self,
+        rate_limits: dict[str, tuple[float, float]] | None = None,
+        manager: IrcManager | None = None,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT
+    ) -> None:
+        self.protocol: LineProtocol | None                = None
+        self.host                                         = host
+        self.port                                         = port
+        self.manager                                      = manager or IrcManager()
+        self.logger                                       = logging.getLogger('OsuSocket')
+        self.raw_logger                                   = logging.getLogger('OsuSocket.raw')
+        self.threadLoop                                   = Utils.ThreadLoop()
+        # the loop the connection lives on, the caller's (`start_async`) or our own thread's (`start`)
+        self.loop: asyncio.AbstractEventLoop | None       = None
+        self.send_queue                                   = SendQueue(rate_limits)
+        self._stop_event                                  = asyncio.Event()
+        self._supervisor: Future | asyncio.Task | None    = None
+        self._services: list[asyncio.Task]                = []
+        self._joins: dict[str, asyncio.Future]            = {}
+        self._replay: deque[str]                          = deque()
+        self.state                                        = ConnectionState.DISCONNECTED
+        self.reconnects                                   = 0
+        self.replay_dropped                               = 0
+        self.last_recovery: float | None                  = None
+        # raw lines as read, see `start_capture`
+        self.capture: CaptureWriter | None                = None
 
     def start(self, nick: str, passw: str):
+        '''
+            Runs the client on its own event loop in a daemon thread, blocks until connected.
+        '''
         try:
             self.threadLoop.start_async()
+            self.loop = self.threadLoop.loop
             task = self.threadLoop.submit_async(self.connect(nick, passw))
             if task:
-                task.result() # ensure `connect`` finished before submit `monitor_connection`
-            self.threadLoop.submit_async(self.monitor_connection())
+                task.result() # ensure `connect`` finished before submit `supervise`
+            self._supervisor = self.threadLoop.submit_async(self.supervise(nick, passw))
+        except Exception as e:
+            self.logger.exception(e)
+            raise e
 
-            for message in self._pending_messages:
-                self.send(message)
-            self._pending_messages.clear()
+    async def start_async(self, nick: str, passw: str, retry: bool = False):
+        '''
+            Runs the client on the caller's event loop, nothing crosses a thread.
+            With `retry`, a failed first connect is left to the supervisor to
+            retry instead of raising (wrong credentials still raise).
+        '''
+        try:
+            self.loop = asyncio.get_running_loop()
+            try:
+                await self.connect(nick, passw)
+            except OsuCredentialsIncorrect:
+                raise
+            except Exception as e:
+                if not retry: raise
+                self.logger.warning(f"Failed to connect as {nick}: {e}, retrying in the background")
+                self._stop_event.set()
+            self._supervisor = self.loop.create_task(self.supervise(nick, passw))
         except Exception as e:
             self.logger.exception(e)
             raise e
@@ -49,111 +138,222 @@ class OsuSocket:
     
     def cleanup(self):
         self._cancel = True
+        if self._supervisor:
+            self._supervisor.cancel()
+            self._supervisor = None
+        self.close()
+        self.stop_capture()
+
+    def start_capture(self, path: str, nick: str):
+        '''
+            Records every line received from now on to `path`, replayable with
+            `benchmarks.replay`.
+        '''
+        self.stop_capture()
+        self.capture = CaptureWriter(path, nick)
+
+    def stop_capture(self):
+        if self.capture and self.loop and self.loop.is_running() and not self._on_own_loop():
+            # `recv` writes to it on the IRC loop
+            self.loop.call_soon_threadsafe(self.stop_capture)
+            return
+        capture, self.capture = self.capture, None
+        if capture:
+            capture.close()
+
+    def _on_own_loop(self) -> bool:
         try:
-            self.socket.shutdown(socket.SHUT_RDWR)
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def close(self):
+        if self.loop and self.loop.is_running() and not self._on_own_loop():
+            # the tasks and the transport belong to the IRC loop
+            self.loop.call_soon_threadsafe(self.close)
+            return
+
+        for service in self._services:
+            service.cancel()
+        self._services.clear()
+
+        if not self.protocol: return
+        try:
+            self.protocol.close()
         except Exception as e:
             self.logger.exception(e)
         finally:
-            self.socket.close()
+            self.protocol = None
 
     async def connect(self, nick: str, passw: str) -> int:
-        def try_connect(retry_count: int):
-            try:
-                self.socket.connect(("irc.ppy.sh", 6667))
-            except socket.timeout as e:
-                if retry_count <= 5:
-                    sleep(3)
-                    return try_connect(retry_count + 1)
-            except socket.error as err:
-                raise ConnectionError(str(err))
-        
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.state = ConnectionState.CONNECTING
+        try:
+            _, self.protocol = await asyncio.wait_for(
+                asyncio.get_running_loop().create_connection(LineProtocol, self.host, self.port),
+                timeout = 10
+            )
+        except (OSError, asyncio.TimeoutError) as err:
+            raise ConnectionError(str(err) or type(err).__name__)
 
-        await asyncio.to_thread(try_connect, 0)
-        await self.authenticate(nick, passw)
+        self.state = ConnectionState.AUTHENTICATING
+        try:
+            await asyncio.wait_for(self.authenticate(nick, passw), timeout = 15)
+        except asyncio.TimeoutError:
+            raise ConnectionError("timed out waiting for the server to log us in")
 
         self.logger.info("Osu!IRC authenticated")
 
-        self.start_services(self.recv, self.keep_alive)
+        self.start_services(self.recv, self.keep_alive, self.flush_queue)
 
-        chat_list = ircManager.chat_list.copy()
-        ircManager.clear()
-        ircManager.nick = nick
-        ircManager.passw = passw
+        # the chats are kept with their lobby state, staged lines and pattern waiters, a short
+        # drop shouldn't cost any of them. Only who is in them is learned again from the rejoin
+        self.manager.nick = nick
+        self.manager.passw = passw
+        for chat in self.manager.get_chat_list():
+            chat.users.clear()
 
-        for chat, _ in chat_list.items():
-            await self.join(chat)
-        await self.join("BanchoBot")
+        # one round trip for every channel we were in (or were joining), instead of one per channel.
+        # JOINs in flight were lost with the connection, they are sent again and the callers still
+        # waiting on them are resolved by the new reply
+        chats = [name for name in self.manager.chat_list if name.startswith("#")]
+        joined = await self.join_many([*chats, *self._joins.keys(), "BanchoBot"], rejoin=True)
+        for name in chats:
+            if not joined.get(name):
+                # e.g. the lobby was closed while we were away
+                self.manager.remove_chat(name)
+
+        self.state = ConnectionState.READY
+        # whatever could not be sent while we were away goes out first, in order
+        while self._replay:
+            self.send_queue.put(self._replay.popleft())
 
         return 0
 
-    async def monitor_connection(self):
+    async def supervise(self, nick: str, passw: str):
+        '''
+            Wakes up as soon as a service reports a failure and reconnects,
+            retrying with jittered exponential backoff.
+        '''
         while not hasattr(self, '_cancel'):
-            if self._stop_event.is_set():
-                self.logger.info("An error occurred, reconnecting...")
+            await self._stop_event.wait()
+            if hasattr(self, '_cancel'): return
+
+            failed_at = time.monotonic()
+            self.logger.info("Connection lost, reconnecting...")
+            self.state = ConnectionState.DISCONNECTED
+
+            attempt = 0
+            while not hasattr(self, '_cancel'):
+                # only once the old services are done, a cancelled `flush_queue` puts its
+                # unsent batch back and that must not reach the new connection
+                await self._stop_services()
+                self._keep_unsent()
+                self._stop_event = asyncio.Event()
                 try:
-                    self.cleanup()
-                    self._stop_event = asyncio.Event()
-                    await self.connect(ircManager.nick, ircManager.passw)
-                except Exception as e:
-                    self.logger.exception(e)
+                    await self.connect(nick, passw)
+                    break
+                except OsuCredentialsIncorrect as e:
+                    self.state = ConnectionState.DISCONNECTED
+                    self.logger.error(e)
                     return
-            await asyncio.sleep(1)
+                except Exception as e:
+                    self.state = ConnectionState.BACKOFF
+                    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)) if attempt else 0
+                    attempt += 1
+                    self.logger.warning(f"Reconnect attempt {attempt} failed: {e}, retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+
+            self.reconnects += 1
+            self.last_recovery = time.monotonic() - failed_at
+            self.logger.info(f"Reconnected after {self.last_recovery:.2f}s")
+
+    @property
+    def gave_up(self) -> bool:
+        # the supervisor stopped for good, e.g. a reconnect was refused with bad credentials
+        return self.state is ConnectionState.DISCONNECTED and (self._supervisor is None or self._supervisor.done())
+
+    @on_irc_loop
+    async def take_replay(self, chats: list[str]) -> list[str]:
+        '''
+            Removes and returns the chat waiting to be replayed to `chats`, for
+            when they move to another connection.
+        '''
+        chats = set(chats)
+        taken: list[str] = []
+        kept: deque[str] = deque()
+        for message in self._replay:
+            (taken if message.split(" ", 2)[1] in chats else kept).append(message)
+        self._replay = kept
+        return taken
+
+    async def _stop_services(self):
+        services = list(self._services)
+        self.close()
+        await asyncio.gather(*services, return_exceptions=True)
+
+    def _keep_unsent(self):
+        # queued chat is replayed once we are back, JOINs are redone by `connect` and
+        # PONG/KEEP_ALIVE belong to the dead connection
+        self.state = ConnectionState.DISCONNECTED
+        for entry in self.send_queue.clear():
+            message = entry.data.decode("utf-8").rstrip("\n")
+            if message.startswith("PRIVMSG "):
+                self._replay_later(message)
+
+    def _replay_later(self, message: str):
+        if len(self._replay) >= REPLAY_LIMIT:
+            self._replay.popleft()
+            self.replay_dropped += 1
+        self._replay.append(message)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state"         : self.state.name,
+            "reconnects"    : self.reconnects,
+            "last_recovery" : self.last_recovery,
+            "replay_depth"  : len(self._replay),
+            "replay_dropped": self.replay_dropped,
+            **{f"send_queue_{key}": value for key, value in self.send_queue.stats().items()}
+        }
+
+    async def read_lines(self) -> Iterable[str]:
+        if not self.protocol:
+            raise ConnectionError("not connected")
+        try:
+            return await self.protocol.read_lines()
+        except ConnectionResetError as e:
+            raise ConnectionError(str(e))
 
     async def authenticate(self, nick: str, passw: str):
-        self.send("PASS %s" % passw)
-        self.send("NICK %s" % nick)
-        remain = ""
+        # bypass the send queue, its writer only starts once we are logged in
+        await self.write(bytes("PASS %s\nNICK %s\n" % (passw, nick), encoding="utf-8"))
         while not hasattr(self, '_cancel'):
-            try:
-                response: str = self.socket.recv(1024).decode("utf-8")
-                response = remain + response
-                data = response.split("\r\n")
-                for i in range(len(data) - 1):
-                    line = data[i].split(" ")
-                    match line[1]:
-                        case "464":
-                            raise OsuCredentialsIncorrect
-                        case "376":
-                            return
-                remain = data.pop()
-                await asyncio.sleep(0.05)
-            except Exception as e:
-                self._stop_event.set()
-                raise e
+            for line in await self.read_lines():
+                data = line.split(" ")
+                if len(data) < 2: continue
+                match data[1]:
+                    case "464":
+                        raise OsuCredentialsIncorrect
+                    case "376":
+                        return
     
     def start_services(self, *args):
-        if len(args) > 0:
-            for service in args:
-                self.threadLoop.submit_async(service())
+        # always called from `connect`, i.e. on the IRC loop
+        loop = asyncio.get_running_loop()
+        for service in args:
+            self._services.append(loop.create_task(service()))
 
     async def recv(self):
-        remain = ""
         while not hasattr(self, '_cancel'):
             try:
-                response: str = remain + self.socket.recv(1024).decode("utf-8")
-                data = response.split("\n")
-                remain = data.pop()
-                for msg in data:
-                    if msg.strip() == "PING cho.ppy.sh":
-                        self.send("PING cho.ppy.sh")
-                        continue
-                    parsed_msg = parse(msg)
-                    if len(parsed_msg):
-                        self.logger.debug(msg)
-                        ircManager.update(parsed_msg)
-                        if hasattr(self, '_join_events'):
-                            if parsed_msg[2] == ircManager.nick:
-                                chat_added_event, _ = self._join_events
-                                chat_added_event.set()
-                await asyncio.sleep(0.05)
-            except NoSuchChannel as e:
-                if hasattr(self, '_join_events'):
-                    _, exception_event = self._join_events
-                    exception_event.set()
-                self.logger.exception(e)
-                await asyncio.sleep(0.05)
-                continue
+                lines = await self.read_lines()
+                if self.capture:
+                    self.capture.write(lines)
+                if metrics.enabled:
+                    LINES_READ.inc(len(lines))
+                    READ_BATCH.observe(len(lines))
+                for msg in lines:
+                    self.handle_line(msg)
             except asyncio.CancelledError:
                 self.logger.debug("Cancelling recv")
                 return
@@ -162,10 +362,31 @@ class OsuSocket:
                 self._stop_event.set()
                 return
 
+    def handle_line(self, msg: str):
+        timed = metrics.enabled
+        try:
+            if timed: started = time.perf_counter()
+            parsed_msg = parse(msg)
+            if timed:
+                parsed = time.perf_counter()
+                PARSE_TIME.observe(parsed - started)
+            if not parsed_msg: return
+            if parsed_msg.kind is MessageKind.PING:
+                self.send_queue.put("PONG " + parsed_msg.text, Priority.HIGH)
+                return
+            self.raw_logger.debug(msg)
+            self.manager.update(parsed_msg)
+            if timed: UPDATE_TIME.observe(time.perf_counter() - parsed)
+            if parsed_msg.kind is MessageKind.JOIN and parsed_msg.sender == self.manager.nick:
+                self._resolve_join(parsed_msg.channel, True)
+        except NoSuchChannel as e:
+            self._resolve_join(e.message, False)
+            self.logger.warning(e)
+
     async def keep_alive(self):
         while not hasattr(self, '_cancel'):
             try:
-                self.send("KEEP_ALIVE")
+                self.send_queue.put("KEEP_ALIVE")
                 await asyncio.sleep(30)
             except asyncio.CancelledError:
                 self.logger.debug("Cancelling keep_alive")
@@ -175,50 +396,153 @@ class OsuSocket:
                 self.logger.exception(e)
                 return
 
-    def send(self, message: str):
+    async def write(self, data: bytes):
+        if not self.protocol:
+            raise ConnectionError("not connected")
+        self.protocol.write(data)
+        await self.protocol.drain()
+
+    async def flush_queue(self):
         try:
-            self.socket.sendall(bytes(message + '\n', encoding="utf-8"))
+            await self.send_queue.run(self.write)
+        except asyncio.CancelledError:
+            self.logger.debug("Cancelling flush_queue")
         except Exception as e:
             self.logger.exception(e)
-            self._pending_messages.append(message)
             self._stop_event.set()
 
-    async def join(self, chat: str) -> (Channel | None):
-        if not ircManager.get_chat(chat):
-            if chat.startswith('#'):
-                self.send(f"JOIN {chat}")
-                chat_added_event = asyncio.Event()
-                exception_event = asyncio.Event()
-                self._join_events = (chat_added_event, exception_event)
-                
-                try:
-                    _, pending = await asyncio.wait(
-                        [
-                            asyncio.create_task(chat_added_event.wait()),
-                            asyncio.create_task(exception_event.wait())
-                        ],
-                        return_when=asyncio.FIRST_COMPLETED
-                    )
-                    
-                    for task in pending:
-                        task.cancel()
-                    
-                    if exception_event.is_set():
-                        return None
-                finally:
-                    del self._join_events
+    @on_irc_loop
+    async def send(self, message: str, priority: Priority | None = None):
+        if self.state is ConnectionState.READY:
+            self.send_queue.put(message, priority)
+        elif message.startswith("PRIVMSG "):
+            self._replay_later(message)
+
+    def _resolve_join(self, chat: str, joined: bool):
+        future = self._joins.pop(chat, None)
+        if future and not future.done():
+            future.set_result(joined)
+
+    def _request_joins(self, chats: list[str], resend: bool = False) -> dict[str, asyncio.Future]:
+        futures: dict[str, asyncio.Future] = {}
+        to_send: list[str] = []
+        for chat in chats:
+            future = self._joins.get(chat)
+            if not future:
+                future = self._joins[chat] = asyncio.get_running_loop().create_future()
+                to_send.append(chat)
+            elif resend:
+                to_send.append(chat)
+            # otherwise share the JOIN in flight instead of sending a second one
+            futures[chat] = future
+
+        line: list[str] = []
+        length = 0
+        for chat in to_send:
+            if line and length + len(chat) + 1 > JOIN_LINE_LIMIT:
+                self.send_queue.put("JOIN " + ",".join(line))
+                line, length = [], 0
+            line.append(chat)
+            length += len(chat) + 1
+        if line:
+            self.send_queue.put("JOIN " + ",".join(line))
+        return futures
+
+    async def _wait_join(self, chat: str, future: asyncio.Future, timeout: float | None) -> (Channel | None):
+        try:
+            joined = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Timed out joining {chat}")
+            if self._joins.get(chat) is future:
+                del self._joins[chat]
+            return None
+        return self.manager.get_chat(chat) if joined else None
+
+    @on_irc_loop
+    async def join(self, chat: str, timeout: float | None = 10) -> (Channel | None):
+        return (await self.join_many([chat], timeout)).get(chat)
+
+    @on_irc_loop
+    async def join_many(
+        self,
+        chats: list[str],
+        timeout: float | None = 10,
+        rejoin: bool = False
+    ) -> dict[str, Channel | None]:
+        '''
+            Join every chat at once: channels go out as comma separated JOIN
+            lines and are all awaited together, DMs need no JOIN at all.
+            `rejoin` sends a JOIN even for channels we are in or have one in
+            flight for, after a reconnect.
+        '''
+        result: dict[str, Channel | None] = {}
+        channels: list[str] = []
+        for chat in dict.fromkeys(chats):
+            if chat.startswith('#') and (rejoin or not self.manager.get_chat(chat)):
+                channels.append(chat)
+            elif self.manager.get_chat(chat):
+                result[chat] = self.manager.get_chat(chat)
             else:
-                ircManager.add_chat(chat)
-        return ircManager.get_chat(chat)
+                self.manager.add_chat(chat)
+                result[chat] = self.manager.get_chat(chat)
+
+        if channels:
+            futures = self._request_joins(channels, rejoin)
+            joined = await asyncio.gather(*[
+                self._wait_join(chat, future, timeout) for chat, future in futures.items()
+            ])
+            result.update(zip(futures.keys(), joined))
+        return result
         
-    
-    def part(self, chat: str):
-        if ircManager.get_chat(chat):
-            self.send(f"PART {chat}")
-            ircManager.remove_chat(chat)
+    @on_irc_loop
+    async def part(self, chat: str):
+        if self.manager.get_chat(chat):
+            await self.send(f"PART {chat}")
+            self.manager.remove_chat(chat)
 
+    @on_irc_loop
     async def privmsg(self, chat: str, message: str):
-        if not ircManager.get_chat(chat):
+        if not self.manager.get_chat(chat):
             await self.join(chat)
-        self.send(f"PRIVMSG {chat} {message}")
-        
\ No newline at end of file
+        # the server doesn't echo our own lines back, log them here
+        if self.manager.chat_log:
+            self.manager.chat_log.append(chat, self.manager.nick, message)
+        await self.send(f"PRIVMSG {chat} {message}")
+
+    @on_irc_loop
+    async def take_staged(self, chat: str) -> deque[StagedLine]:
+        '''
+            Drains the staged messages of `chat`, on the IRC loop so the buffer is
+            only ever touched from one thread.
+        '''
+        channel = self.manager.get_chat(chat)
+        return channel.get_staged_messages() if channel else deque()
+
+    @on_irc_loop
+    async def lobby_summary(self, chat: str) -> (list[str] | None):
+        '''
+            `LobbyState.summary` of lobby `chat`, built on the IRC loop that
+            updates it. None if it is not a joined lobby.
+        '''
+        channel = self.manager.get_chat(chat)
+        return channel.lobby.summary() if channel and channel.lobby else None
+
+    @on_irc_loop
+    async def query(
+        self,
+        chat: str,
+        message: str,
+        pattern: str,
+        key: str | None = None,
+        timeout: float | None = 10
+    ) -> tuple[str | Any, ...]:
+        '''
+            Send `message` to `chat` and wait for the reply matching `pattern`,
+            the waiter is registered before sending so a fast reply can't be missed.
+        '''
+        channel = await self.join(chat)
+        if not channel:
+            return tuple()
+        future = channel.expect(pattern, key)
+        await self.send(f"PRIVMSG {chat} {message}")
+        return await channel.listen_for_pattern(pattern, key, timeout, future)
@@ -1,39 +1,104 @@
 from .Exceptions import NoSuchChannel
+from enum import Enum
+from typing import NamedTuple
 
-def parse(message: str) -> list[str]:
+class MessageKind(Enum):
+    JOIN         = 0
+    MESSAGE      = 1
+    PART         = 2
+    QUIT         = 3
+    NAMES        = 4
+    END_OF_NAMES = 5
+    TOPIC        = 6
+    MODE         = 7
+    PING         = 8
+
+# plain module globals, enum attribute lookups are noticeably slower on the hot path
+JOIN, MESSAGE, PART, QUIT, NAMES, END_OF_NAMES, TOPIC, MODE, PING = MessageKind
+
+class ParsedMessage(NamedTuple):
+    '''
+        (kind, sender, channel, text). The field getters of a NamedTuple are
+        implemented in C, and `parse` builds instances with `tuple.__new__`
+        directly, skipping the generated Python level `__new__`.
+    '''
+    kind:    MessageKind
+    sender:  str
+    channel: str
+    text:    str
+
+    @property
+    def names(self) -> list[str]:
+        # 353 name lists prefix operators with @ and voiced users with +
+        return [name.lstrip("@+") for name in self.text.split(" ") if name]
+
+    def __repr__(self) -> str:
+        return f"ParsedMessage({self.kind.name}, {self.sender!r}, {self.channel!r}, {self.text!r})"
+
+_new = tuple.__new__
+
+def parse(message: str) -> (ParsedMessage | None):
     '''
+        :[name]!cho@ppy.sh JOIN :[channel_name]
+        :[name]!cho@ppy.sh PART :[channel_name]
         :[name]!cho@ppy.sh QUIT :quit
-        :cho.ppy.sh 353 [nick] = [channel_name] :[name_list]
         :[name]!cho@ppy.sh PRIVMSG [channel_name] :[message]
+        :BanchoBot!cho@ppy.sh MODE [channel_name] +v [name]
+        :cho.ppy.sh 332 [nick] [channel_name] :[topic]
+        :cho.ppy.sh 353 [nick] = [channel_name] :[name_list]
+        :cho.ppy.sh 366 [nick] [channel_name] :End of /NAMES list.
         :cho.ppy.sh 403 [nick] [channel_name] :No such channel
+        PING cho.ppy.sh
     '''
-    message = message.strip()
-    if message == "": return []
-    data = message.split(":")
-    mData = data[1].split(" ")
-
-    retData = []
-    if not mData[1] == "QUIT":
-        match (mData[1]):
-            case "401" | "403":
-                raise NoSuchChannel(mData[3])
-            case "323" |"353":
-                # indicator, channel, username
-                retData += ["0", mData[4]] + data[2].split(" ")
-
-            case "JOIN":
-                # indicator, channel, username
-                retData += ["0", data[2], mData[0].split("!")[0]]
-
-            case "PRIVMSG":
-                # indicator, channel, username, message
-                retData += [
-                    "1",
-                    mData[2],
-                    mData[0].split("!")[0], 
-                    ":".join(data[2: len(data)])
-                ]
-            case "PART":
-                # indicator, channel, username
-                retData += ["2", data[2], mData[0].split("!")[0]]
-    return retData
\ No newline at end of file
+    # one split in C covers every line we care about: prefix, command, first param, the rest
+    params = message.split(" ", 3)
+    # chat lines are the bulk of the traffic, they take the shortest way through
+    try:
+        if params[1] == "PRIVMSG":
+            prefix = params[0]
+            text = params[3]
+            bang = prefix.find("!")
+            return _new(ParsedMessage, (
+                MESSAGE,
+                prefix[1:bang] if bang > 0 else prefix[1:],
+                params[2],
+                text[1:] if text[:1] == ":" else text
+            ))
+    except IndexError:
+        pass # too short for a chat line, handled below
+
+    if not message.startswith(":"):
+        if message.startswith("PING"):
+            return _new(ParsedMessage, (PING, "", "", message[5:]))
+        return None
+    if len(params) < 3: return None
+    command = params[1]
+    sender = params[0][1:].partition("!")[0]
+
+    # the rest roughly in order of how often they show up
+    if command == "PRIVMSG":
+        return _new(ParsedMessage, (MESSAGE, sender, params[2], ""))
+    if command == "JOIN":
+        return _new(ParsedMessage, (JOIN, sender, params[2].lstrip(":"), ""))
+    if command == "PART":
+        return _new(ParsedMessage, (PART, sender, params[2].lstrip(":"), ""))
+    if command == "QUIT":
+        return _new(ParsedMessage, (QUIT, sender, "", message.partition(" :")[2]))
+    if len(params) < 4: return None
+    rest = params[3]
+    if command == "MODE":
+        return _new(ParsedMessage, (MODE, sender, params[2], rest))
+    if command == "353":
+        # "= [channel_name] :[name_list]"
+        names = rest.split(" ", 2)
+        if len(names) < 3: return None
+        _, channel, text = names
+        return _new(ParsedMessage, (NAMES, sender, channel, text[1:] if text[:1] == ":" else text))
+    if command == "332":
+        channel, _, text = rest.partition(" :")
+        return _new(ParsedMessage, (TOPIC, sender, channel, text))
+    if command == "366":
+        return _new(ParsedMessage, (END_OF_NAMES, sender, rest.partition(" ")[0], ""))
+    if command == "401" or command == "403":
+        raise NoSuchChannel(rest.partition(" ")[0])
+    return None
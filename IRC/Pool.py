@@ -0,0 +1,223 @@
+from collections import deque
+from typing import Any, Callable
+
+from .OsuSocket import OsuSocket, ConnectionState, DEFAULT_HOST, DEFAULT_PORT
+from .IrcManager import IrcManager
+from .Channel import Channel, StagedLine
+from .SendQueue import Priority
+
+import asyncio
+import logging
+import os
+
+# how often routes on a connection that failed to come back are moved elsewhere
+FAILOVER_INTERVAL = 5
+
+class OsuSocketPool:
+    '''
+        Several osu!irc connections, one per account, behind the OsuSocket interface.
+
+        Every chat is routed to one connection and stays there (sticky), new
+        chats go to the connection with the fewest chats and the shortest send
+        queue. When a connection can't reconnect right away, or gave up, its
+        chats and the chat it kept for them are moved to the remaining ones.
+        Lobbies made through `create_lobby` add the other accounts as
+        referees so they can take the lobby over.
+    '''
+    def __init__(
+        self,
+        accounts: list[tuple[str, str]],
+        rate_limits: dict[str, tuple[float, float]] | None = None,
+        manager_options: dict[str, Any] | None = None,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT
+    ) -> None:
+        if not accounts:
+            raise ValueError("at least one account is required")
+        self.logger                                  = logging.getLogger('OsuSocket')
+        self.accounts                                = accounts
+        self.sockets: list[OsuSocket]                = [
+            OsuSocket(rate_limits, IrcManager(**(manager_options or {})), host, port) for _ in accounts
+        ]
+        self.nicks: dict[OsuSocket, str]             = {
+            socket: nick for socket, (nick, _) in zip(self.sockets, accounts)
+        }
+        self.routes: dict[str, OsuSocket]            = {}
+        # `!mp make`s waiting for BanchoBot, counted as load so a batch is spread out
+        self.creating: dict[OsuSocket, int]          = {}
+        self.failovers                               = 0
+        self._failover_task: asyncio.Task | None     = None
+
+    def start(self):
+        # every connection on its own thread
+        for socket, (nick, passw) in zip(self.sockets, self.accounts):
+            socket.start(nick, passw)
+        self._failover_task = asyncio.get_running_loop().create_task(self.watch())
+
+    async def start_async(self):
+        # all connections on the caller's loop, one failing account doesn't keep the others down
+        await asyncio.gather(*[
+            socket.start_async(nick, passw, retry=len(self.sockets) > 1)
+            for socket, (nick, passw) in zip(self.sockets, self.accounts)
+        ])
+        self._failover_task = asyncio.get_running_loop().create_task(self.watch())
+
+    def cleanup(self):
+        if self._failover_task:
+            self._failover_task.cancel()
+            self._failover_task = None
+        for socket in self.sockets:
+            socket.cleanup()
+
+    def start_capture(self, path: str):
+        # one file per account, "capture.bin" -> "capture.<nick>.bin" when there are several
+        root, ext = os.path.splitext(path)
+        for socket in self.sockets:
+            nick = self.nicks[socket]
+            socket.start_capture(f"{root}.{nick}{ext}" if len(self.sockets) > 1 else path, nick)
+
+    def stop_capture(self):
+        for socket in self.sockets:
+            socket.stop_capture()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "failovers": self.failovers,
+            **{self.nicks[socket]: socket.stats() | {"routes": self.load(socket)} for socket in self.sockets}
+        }
+
+    def load(self, socket: OsuSocket) -> int:
+        return sum(1 for routed in self.routes.values() if routed is socket) + self.creating.get(socket, 0)
+
+    def least_loaded(self, exclude: OsuSocket | None = None) -> OsuSocket:
+        candidates = [socket for socket in self.sockets if socket is not exclude]
+        ready = [socket for socket in candidates if socket.state is ConnectionState.READY]
+        # nothing is up: pick anyway, the socket keeps chat for replay until it reconnects
+        return min(ready or candidates or self.sockets, key=lambda socket: (self.load(socket), len(socket.send_queue)))
+
+    def route(self, chat: str) -> OsuSocket:
+        socket = self.routes.get(chat)
+        if socket is None:
+            socket = self.routes[chat] = self.least_loaded()
+        return socket
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(FAILOVER_INTERVAL)
+            for socket in self.sockets:
+                # BACKOFF: the immediate reconnect already failed
+                if socket.state is ConnectionState.BACKOFF or socket.gave_up:
+                    try:
+                        await self.fail_over(socket)
+                    except Exception as e:
+                        # tried again next round, failover must outlive a single error
+                        self.logger.exception(f"Failed to move chats off {self.nicks[socket]}: {e}")
+
+    async def fail_over(self, failed: OsuSocket):
+        chats = [chat for chat, socket in self.routes.items() if socket is failed]
+        if not chats: return
+        target = self.least_loaded(exclude=failed)
+        if target is failed or target.state is not ConnectionState.READY:
+            return
+        self.logger.warning(f"Moving {len(chats)} chats from {self.nicks[failed]} to {self.nicks[target]}")
+        for chat in chats:
+            self.routes[chat] = target
+            # forget it on the failed connection, otherwise its reconnect joins it a second time
+            await failed.part(chat)
+        await target.join_many(chats)
+        # chat sent while it was down, it would otherwise go to chats the failed connection left
+        for message in await failed.take_replay(chats):
+            await target.send(message)
+        self.failovers += 1
+
+    def subscribe(self, name: str, listener: Callable[[Channel], None]):
+        # on every connection, the chat may move between them
+        for socket in self.sockets:
+            socket.manager.subscribe(name, listener)
+
+    def unsubscribe(self, name: str):
+        for socket in self.sockets:
+            socket.manager.unsubscribe(name)
+
+    async def join(self, chat: str, timeout: float | None = 10) -> (Channel | None):
+        channel = await self.route(chat).join(chat, timeout)
+        if not channel:
+            self.routes.pop(chat, None)
+        return channel
+
+    async def join_many(self, chats: list[str], timeout: float | None = 10) -> dict[str, Channel | None]:
+        by_socket: dict[OsuSocket, list[str]] = {}
+        for chat in chats:
+            by_socket.setdefault(self.route(chat), []).append(chat)
+        result: dict[str, Channel | None] = {}
+        for joined in await asyncio.gather(*[
+            socket.join_many(socket_chats, timeout) for socket, socket_chats in by_socket.items()
+        ]):
+            result |= joined
+        for chat, channel in result.items():
+            if not channel:
+                self.routes.pop(chat, None)
+        return result
+
+    async def part(self, chat: str):
+        socket = self.routes.pop(chat, None)
+        if socket:
+            await socket.part(chat)
+
+    async def privmsg(self, chat: str, message: str):
+        await self.route(chat).privmsg(chat, message)
+
+    async def send(self, message: str, priority: Priority | None = None):
+        await self.least_loaded().send(message, priority)
+
+    def get_chat(self, chat: str) -> (Channel | None):
+        socket = self.routes.get(chat)
+        return socket.manager.get_chat(chat) if socket else None
+
+    async def take_staged(self, chat: str) -> deque[StagedLine]:
+        socket = self.routes.get(chat)
+        return await socket.take_staged(chat) if socket else deque()
+
+    async def lobby_summary(self, chat: str) -> (list[str] | None):
+        socket = self.routes.get(chat)
+        return await socket.lobby_summary(chat) if socket else None
+
+    async def query(
+        self,
+        chat: str,
+        message: str,
+        pattern: str,
+        key: str | None = None,
+        timeout: float | None = 10
+    ) -> tuple[str | Any, ...]:
+        # the reply comes back on the connection that asked, BanchoBot is not routed
+        socket = self.least_loaded() if chat == "BanchoBot" else self.route(chat)
+        return await socket.query(chat, message, pattern, key, timeout)
+
+    async def create_lobby(
+        self,
+        command: str,
+        pattern: str,
+        key: str | None = None,
+        timeout: float | None = 10
+    ) -> tuple[str | Any, ...]:
+        '''
+            Sends `!mp make` on the least loaded connection and pins the new
+            lobby (the first group of `pattern` is its id) to that connection.
+        '''
+        socket = self.least_loaded()
+        self.creating[socket] = self.creating.get(socket, 0) + 1
+        try:
+            matches = await socket.query("BanchoBot", command, pattern, key, timeout)
+        finally:
+            self.creating[socket] -= 1
+        if not matches:
+            return matches
+
+        chat = f"#mp_{matches[0]}"
+        self.routes[chat] = socket
+        others = [self.nicks[other] for other in self.sockets if other is not socket]
+        if others:
+            # lets any other account join the lobby if this connection goes down
+            await socket.privmsg(chat, "!mp addref " + " ".join(others))
+        return matches
@@ -0,0 +1,214 @@
+from collections import Counter
+from concurrent.futures import Future
+from threading import Event, Thread
+from types import FrameType
+
+import asyncio
+import contextlib
+import cProfile
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+
+# seconds between two samples of every profiled thread
+SAMPLE_INTERVAL = 0.005
+# from 3.12 cProfile runs on sys.monitoring: one profile sees every thread, and
+# enabling a second one anywhere raises
+PER_INTERPRETER = sys.version_info >= (3, 12)
+
+async def loop_threads(loops: dict[str, asyncio.AbstractEventLoop]) -> dict[str, int]:
+    '''
+        The id of the thread each loop runs on, asked on the loop itself.
+    '''
+    futures: dict[str, Future] = {}
+    for name, loop in loops.items():
+        future = futures[name] = Future()
+        loop.call_soon_threadsafe(lambda future=future: future.set_result(threading.get_ident()))
+    return {name: await asyncio.wrap_future(future) for name, future in futures.items()}
+
+def unique_loops(loops: dict[str, asyncio.AbstractEventLoop]) -> dict[str, asyncio.AbstractEventLoop]:
+    # the first name wins, e.g. the IRC connections share the bot's loop unless they run on threads
+    seen: dict[asyncio.AbstractEventLoop, str] = {}
+    for name, loop in loops.items():
+        seen.setdefault(loop, name)
+    return {name: loop for loop, name in seen.items()}
+
+def collapse(frame: FrameType | None) -> str:
+    names: list[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class Profiler:
+    '''
+        Profiles event loops that may each run on their own thread, one
+        profile at a time.
+
+        "sample" looks at every loop's stack every `SAMPLE_INTERVAL` from a
+        separate thread and gives collapsed stacks (flamegraph.pl, speedscope),
+        cheap enough for production. "cprofile" enables a `cProfile.Profile`
+        on every loop's thread (a single one from 3.12, it sees every thread)
+        and gives their merged pstats, exact but slows the loops down
+        noticeably.
+    '''
+    def __init__(self, loops: dict[str, asyncio.AbstractEventLoop]) -> None:
+        self.logger                                 = logging.getLogger('Profiler')
+        self.loops                                  = unique_loops(loops)
+        self.mode: str | None                       = None
+        self.started                                = 0.0
+        self._stop                                  = Event()
+        self._sampler: Thread | None                = None
+        self._samples: Counter[str]                 = Counter()
+        self._profiles: dict[str, cProfile.Profile] = {}
+
+    @property
+    def running(self) -> bool:
+        return self.mode is not None
+
+    async def start(self, mode: str = "sample"):
+        if self.running:
+            raise RuntimeError(f"a {self.mode} profile is already running")
+        if mode not in ("sample", "cprofile"):
+            raise ValueError(f"unknown profile mode {mode}")
+        self.mode = mode
+        self.started = time.monotonic()
+        try:
+            if mode == "sample":
+                threads = await loop_threads(self.loops)
+                self._stop.clear()
+                self._samples = Counter()
+                self._sampler = Thread(target=self._sample, args=(threads,), name="profiler", daemon=True)
+                self._sampler.start()
+            elif PER_INTERPRETER:
+                self._profiles = {"all": cProfile.Profile()}
+                self._profiles["all"].enable()
+            else:
+                self._profiles = {name: cProfile.Profile() for name in self.loops}
+                # a profile only sees the thread it was enabled on
+                await self._on_loops(lambda name: self._profiles[name].enable())
+        except BaseException:
+            # e.g. another profiler is active, the next /profile must not find this one running
+            self.mode = None
+            profiles, self._profiles = self._profiles, {}
+            if profiles and not PER_INTERPRETER:
+                # the ones that did get enabled, each on its own thread
+                with contextlib.suppress(Exception):
+                    await self._on_loops(lambda name: profiles[name].disable())
+            raise
+        self.logger.info(f"Started a {mode} profile of {', '.join(self.loops)}")
+
+    async def stop(self) -> tuple[str, bytes]:
+        '''
+            Returns a file name and the profile: collapsed stacks for "sample",
+            pstats (load with `pstats.Stats(path)`) for "cprofile".
+        '''
+        if not self.running:
+            raise RuntimeError("no profile is running")
+        mode, self.mode = self.mode, None
+        stamp = time.strftime("%Y-%m-%d@%H.%M.%S")
+        self.logger.info(f"Stopped the {mode} profile after {time.monotonic() - self.started:.1f}s")
+        if mode == "sample":
+            self._stop.set()
+            await asyncio.to_thread(self._sampler.join)
+            self._sampler = None
+            data = "".join(f"{stack} {count}\n" for stack, count in self._samples.most_common())
+            return f"profile-{stamp}.collapsed.txt", data.encode("utf-8")
+
+        if PER_INTERPRETER:
+            self._profiles["all"].disable()
+        else:
+            await self._on_loops(lambda name: self._profiles[name].disable())
+        profiles, self._profiles = list(self._profiles.values()), {}
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return f"profile-{stamp}.pstats", marshal.dumps(stats.stats)
+
+    async def _on_loops(self, action):
+        futures: list[Future] = []
+        for name, loop in self.loops.items():
+            future = Future()
+            def run(name=name, future=future):
+                try:
+                    action(name)
+                    future.set_result(None)
+                except BaseException as e:
+                    future.set_exception(e)
+            loop.call_soon_threadsafe(run)
+            futures.append(future)
+        for future in futures:
+            await asyncio.wrap_future(future)
+
+    def _sample(self, threads: dict[str, int]):
+        samples = self._samples
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for name, ident in threads.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    samples[f"{name};{collapse(frame)}"] += 1
+
+class LagMonitor:
+    '''
+        Logs every time a loop is blocked for longer than `threshold` seconds.
+
+        Each loop bumps a heartbeat every `interval`. A watchdog thread that
+        finds a heartbeat late logs the stack of the loop's thread, i.e. the
+        callback that is blocking it, while it still blocks. The loop logs the
+        total once it gets going again.
+    '''
+    def __init__(self, loops: dict[str, asyncio.AbstractEventLoop], threshold: float = 0.1, interval: float = 0.05) -> None:
+        self.logger                          = logging.getLogger('Profiler')
+        self.loops                           = unique_loops(loops)
+        self.threshold                       = threshold
+        self.interval                        = interval
+        self.beats: dict[str, float]         = {}
+        self.threads: dict[str, int]         = {}
+        self.lag: dict[str, float]           = {name: 0.0 for name in self.loops}
+        self.stalls                          = 0
+        self._tasks: list[Future]            = []
+        self._stop                           = Event()
+        self._watchdog: Thread | None        = None
+
+    def start(self):
+        for name, loop in self.loops.items():
+            self._tasks.append(asyncio.run_coroutine_threadsafe(self.heartbeat(name), loop))
+        self._watchdog = Thread(target=self.watch, name="lag-monitor", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+    async def heartbeat(self, name: str):
+        self.threads[name] = threading.get_ident()
+        while True:
+            self.beats[name] = before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = self.lag[name] = time.monotonic() - before - self.interval
+            if lag > self.threshold:
+                self.stalls += 1
+                self.logger.warning(f"The {name} loop was blocked for {lag * 1000:.0f}ms")
+
+    def watch(self):
+        reported: dict[str, float] = {}
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            for name, beat in list(self.beats.items()):
+                if now - beat - self.interval <= self.threshold or reported.get(name) == beat:
+                    continue
+                reported[name] = beat # once per stall
+                frame = sys._current_frames().get(self.threads.get(name))
+                stack = "".join(traceback.format_stack(frame)) if frame else "(no stack)"
+                self.logger.warning(
+                    f"The {name} loop is blocked for {(now - beat) * 1000:.0f}ms so far, in:\n{stack}"
+                )
@@ -0,0 +1,185 @@
+from collections import deque
+from enum import IntEnum
+from typing import Awaitable, Callable
+
+import asyncio
+import time
+
+class Priority(IntEnum):
+    HIGH   = 0 # PONG, JOIN, PART, !mp commands
+    NORMAL = 1 # chat relay
+
+# target kind -> (tokens per second, burst size)
+DEFAULT_LIMITS: dict[str, tuple[float, float]] = {
+    "channel": (2.0, 10),
+    "bancho" : (1.0, 5),
+    "dm"     : (1.0, 5),
+}
+
+def classify(message: str) -> tuple[Priority, str | None]:
+    '''
+        Returns (priority, target kind). Only PRIVMSG lines are rate limited,
+        everything else is connection housekeeping and goes out right away.
+    '''
+    command, _, rest = message.partition(" ")
+    if command != "PRIVMSG":
+        return Priority.HIGH, None
+
+    target, _, text = rest.partition(" ")
+    if target == "BanchoBot":
+        kind = "bancho"
+    elif target.startswith("#"):
+        kind = "channel"
+    else:
+        kind = "dm"
+
+    if text.startswith("!mp"):
+        return Priority.HIGH, kind
+    return Priority.NORMAL, kind
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate     = rate
+        self.capacity = capacity
+        self.tokens   = capacity
+        self.updated  = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_consume(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class QueuedMessage:
+    __slots__ = ("data", "kind", "priority", "queued_at")
+
+    def __init__(self, data: bytes, kind: str | None, priority: Priority, queued_at: float) -> None:
+        self.data      = data
+        self.kind      = kind
+        self.priority  = priority
+        self.queued_at = queued_at
+
+class SendQueue:
+    '''
+        Outgoing IRC lines, drained by a single writer task.
+
+        Lines are kept in one FIFO per (priority, target kind), so ordering is
+        preserved for each target while higher priority lanes always get the
+        bucket's tokens first. Every line that is ready when the writer wakes
+        up is coalesced into a single write.
+    '''
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float]] | None = None,
+        max_batch_bytes: int = 4096
+    ) -> None:
+        self.limits                                               = DEFAULT_LIMITS | (limits or {})
+        self.max_batch_bytes                                      = max_batch_bytes
+        self.buckets: dict[str, TokenBucket]                      = {
+            kind: TokenBucket(rate, capacity) for kind, (rate, capacity) in self.limits.items()
+        }
+        self.lanes: list[dict[str | None, deque[QueuedMessage]]] = [{} for _ in Priority]
+        self._wakeup                                              = asyncio.Event()
+
+        self.sent       = 0
+        self.batches    = 0
+        self.wait_total = 0.0
+        self.wait_max   = 0.0
+
+    def __len__(self) -> int:
+        return sum(len(q) for lane in self.lanes for q in lane.values())
+
+    def put(self, message: str, priority: Priority | None = None):
+        default_priority, kind = classify(message)
+        if priority is None:
+            priority = default_priority
+        if kind not in self.buckets:
+            kind = None
+
+        entry = QueuedMessage(bytes(message + "\n", encoding="utf-8"), kind, priority, time.monotonic())
+        self.lanes[priority].setdefault(kind, deque()).append(entry)
+        self._wakeup.set()
+
+    def requeue(self, batch: list[QueuedMessage]):
+        # put an unsent batch back in front, keeping its original order
+        for entry in reversed(batch):
+            self.lanes[entry.priority].setdefault(entry.kind, deque()).appendleft(entry)
+        self._wakeup.set()
+
+    def clear(self) -> list[QueuedMessage]:
+        entries = [entry for lane in self.lanes for q in lane.values() for entry in q]
+        entries.sort(key=lambda entry: entry.queued_at)
+        self.lanes = [{} for _ in Priority]
+        return entries
+
+    def _take_batch(self, now: float) -> list[QueuedMessage]:
+        batch: list[QueuedMessage] = []
+        size = 0
+        for lane in self.lanes:
+            for kind, q in lane.items():
+                bucket = self.buckets.get(kind) if kind else None
+                while q and size < self.max_batch_bytes:
+                    if bucket and not bucket.try_consume(now):
+                        break
+                    entry = q.popleft()
+                    batch.append(entry)
+                    size += len(entry.data)
+        return batch
+
+    def _next_delay(self, now: float) -> float | None:
+        delay = None
+        for lane in self.lanes:
+            for kind, q in lane.items():
+                if not q: continue
+                bucket = self.buckets.get(kind) if kind else None
+                wait = bucket.wait_time(now) if bucket else 0
+                if delay is None or wait < delay:
+                    delay = wait
+        return delay
+
+    async def run(self, write: Callable[[bytes], Awaitable[None]]):
+        while True:
+            now = time.monotonic()
+            batch = self._take_batch(now)
+            if not batch:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._next_delay(now))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await write(b"".join(entry.data for entry in batch))
+            except BaseException:
+                self.requeue(batch)
+                raise
+
+            for entry in batch:
+                wait = now - entry.queued_at
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+            self.sent += len(batch)
+            self.batches += 1
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "depth"       : len(self),
+            "depth_high"  : sum(len(q) for q in self.lanes[Priority.HIGH].values()),
+            "depth_normal": sum(len(q) for q in self.lanes[Priority.NORMAL].values()),
+            "sent"        : self.sent,
+            "batches"     : self.batches,
+            "wait_avg"    : self.wait_total / self.sent if self.sent else 0.0,
+            "wait_max"    : self.wait_max,
+        }
@@ -1,4 +1,6 @@
+from collections import deque
 from concurrent.futures import Future
+from typing import Any, Callable
 from threading import Thread
 
 import logging
@@ -22,6 +24,32 @@ class ThreadLoop:
         if self.loop and self.loop.is_running():
             self.loop.call_soon_threadsafe(self.loop.stop)
 
+class Handoff:
+    '''
+        Passes items produced on another thread to `consumer`, called on `loop`.
+
+        Items go through a deque (append and popleft are atomic), and the loop
+        is woken with a single call_soon_threadsafe per batch instead of one
+        per item.
+    '''
+    def __init__(self, loop: asyncio.AbstractEventLoop, consumer: Callable[[Any], None]) -> None:
+        self.loop              = loop
+        self.consumer          = consumer
+        self.items: deque[Any] = deque()
+        self.scheduled         = False
+
+    def put(self, item: Any):
+        self.items.append(item)
+        if not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        # reset before draining, an item appended after the last popleft schedules a new drain
+        self.scheduled = False
+        while self.items:
+            self.consumer(self.items.popleft())
+
 def setup_logging(
     *,
     handler: logging.Handler = logging.StreamHandler(),
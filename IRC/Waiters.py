@@ -0,0 +1,97 @@
+from collections import deque
+from typing import Any
+
+import asyncio
+import re
+
+class PatternWaiters:
+    __slots__ = ("regex", "keyed", "unkeyed")
+
+    def __init__(self, pattern: str) -> None:
+        self.regex                                   = re.compile(pattern)
+        self.keyed: dict[str, deque[asyncio.Future]] = {}
+        self.unkeyed: deque[asyncio.Future]          = deque()
+
+    def is_empty(self) -> bool:
+        # keyed queues are deleted as soon as they run empty
+        return not self.unkeyed and not self.keyed
+
+class WaiterRegistry:
+    '''
+        Any number of coroutines waiting for a line matching a pattern.
+
+        Waiters are grouped by pattern, so a line costs one regex search per
+        distinct pattern however many coroutines wait on it. A pattern with a
+        `(?P<key>...)` group is correlated: the line only wakes the waiter
+        registered with that key, otherwise the oldest unkeyed waiter. Each
+        line wakes at most one waiter per pattern and each waiter only takes
+        its first match.
+    '''
+    def __init__(self) -> None:
+        self.patterns: dict[str, PatternWaiters] = {}
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def expect(self, pattern: str, key: str | None = None) -> asyncio.Future:
+        waiters = self.patterns.get(pattern)
+        if waiters is None:
+            waiters = self.patterns[pattern] = PatternWaiters(pattern)
+        future = asyncio.get_running_loop().create_future()
+        if key is None:
+            waiters.unkeyed.append(future)
+        else:
+            waiters.keyed.setdefault(key, deque()).append(future)
+        return future
+
+    def discard(self, pattern: str, future: asyncio.Future, key: str | None = None):
+        waiters = self.patterns.get(pattern)
+        if waiters is None: return
+        queue = waiters.unkeyed if key is None else waiters.keyed.get(key)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            if key is not None and not queue:
+                del waiters.keyed[key]
+        if waiters.is_empty():
+            del self.patterns[pattern]
+
+    def dispatch(self, text: str) -> int:
+        woken = 0
+        for pattern, waiters in list(self.patterns.items()):
+            found = waiters.regex.search(text)
+            if not found: continue
+
+            key = None
+            queue = None
+            if waiters.keyed and "key" in waiters.regex.groupindex:
+                key = found.group("key")
+                queue = waiters.keyed.get(key)
+            if not queue:
+                key = None
+                queue = waiters.unkeyed
+            while queue:
+                future = queue.popleft()
+                if not future.done():
+                    future.set_result(found.groups())
+                    woken += 1
+                    break
+
+            if key is not None and not queue:
+                del waiters.keyed[key]
+            if waiters.is_empty():
+                del self.patterns[pattern]
+        return woken
+
+    async def wait(
+        self,
+        pattern: str,
+        future: asyncio.Future,
+        key: str | None = None,
+        timeout: float | None = 10
+    ) -> tuple[str | Any, ...]:
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return tuple()
+        finally:
+            self.discard(pattern, future, key)
@@ -1,6 +1,9 @@
 import os
+import atexit
 import logging
 import logging.handlers
+import queue
+import time
 
 from sys import stdout
 from os import path
@@ -31,27 +34,94 @@ LOGGERS = {
     'asyncio'    : logging.INFO,
     'OsuSocket'  : logging.DEBUG,
     'IrcManager' : logging.DEBUG,
+    'ChatLog'    : logging.INFO,
+    'Profiler'   : logging.INFO,
 }
 
+# every raw IRC line is logged at DEBUG on this child of 'OsuSocket', see `configure_raw_lines`
+RAW_LINES = 'OsuSocket.raw'
+
 class CustomFormatterFile(logging.Formatter):
-    def format(self, record):
-        log_fmt = custom_format
-        formatter = logging.Formatter(
-            log_fmt,
-            datefmt,
-            style="{"
-        )
-        return formatter.format(record)
+    def __init__(self):
+        super().__init__(custom_format, datefmt, style="{")
 
 class CustomFormatterConsole(logging.Formatter):
+    def __init__(self):
+        super().__init__(custom_format, datefmt, style="{")
+        # one per level, built once
+        self.formatters = {
+            level: logging.Formatter(log_fmt, datefmt, style="{") for level, log_fmt in FORMATS.items()
+        }
+
     def format(self, record):
-        log_fmt = FORMATS.get(record.levelno)
-        formatter = logging.Formatter(
-            log_fmt,
-            datefmt,
-            style="{"
-        )
-        return formatter.format(record)
+        formatter = self.formatters.get(record.levelno)
+        return formatter.format(record) if formatter else super().format(record)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    '''
+        Hands records to the listener thread unformatted, the stock `prepare`
+        formats them on the calling thread. The queue never leaves the process,
+        only %-style args are merged now in case they are mutated later.
+    '''
+    def prepare(self, record):
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+class SampleFilter(logging.Filter):
+    # lets one record in every `every` through
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self.seen  = 0
+
+    def filter(self, record):
+        self.seen += 1
+        return (self.seen - 1) % self.every == 0
+
+class RateLimitFilter(logging.Filter):
+    # at most `per_second` records a second, the next one let through says how many were skipped
+    def __init__(self, per_second: float):
+        super().__init__()
+        self.rate       = per_second
+        self.tokens     = per_second
+        self.updated    = time.monotonic()
+        self.suppressed = 0
+
+    def filter(self, record):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            self.suppressed += 1
+            return False
+        self.tokens -= 1
+        if self.suppressed:
+            record.msg = f"{record.getMessage()} ({self.suppressed} lines skipped)"
+            record.args = None
+            self.suppressed = 0
+        return True
+
+def configure_raw_lines(mode: str = "all"):
+    '''
+        How much of the raw IRC traffic is logged:
+        "all", "off", "sample:N" (one line in N) or "rate:N" (at most N lines a second).
+    '''
+    logger = logging.getLogger(RAW_LINES)
+    for old in logger.filters[:]:
+        logger.removeFilter(old)
+    logger.setLevel(logging.NOTSET)
+
+    kind, _, value = mode.partition(":")
+    match kind:
+        case "off":
+            # below the logger's level the record is never even created
+            logger.setLevel(logging.INFO)
+        case "sample":
+            logger.addFilter(SampleFilter(int(value or 100)))
+        case "rate":
+            logger.addFilter(RateLimitFilter(float(value or 10)))
     
 def optimize_folder(max_files: int):
     if not os.path.exists("./logs"): return
@@ -78,9 +148,15 @@ stdout_handler = logging.StreamHandler(stdout)
 file_handler.setFormatter(CustomFormatterFile())
 stdout_handler.setFormatter(CustomFormatterConsole())
 
+# the handlers' I/O runs on the listener thread, loggers only put records on the queue
+log_queue = queue.SimpleQueue()
+queue_handler = DeferredQueueHandler(log_queue)
+listener = logging.handlers.QueueListener(log_queue, file_handler, stdout_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
 for name, level in LOGGERS.items():
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    logger.addHandler(file_handler)
-    logger.addHandler(stdout_handler)
+    logger.addHandler(queue_handler)
     logger.propagate = False
\ No newline at end of file
@@ -0,0 +1,220 @@
+'''
+    A stand-in for irc.ppy.sh speaking enough of Bancho's dialect to drive
+    `OsuSocket`: login (376 / 464), JOIN with 332/353/366 or 403, PART,
+    PING/PONG, and BanchoBot's `!mp make` replies.
+
+    On top of that it can fake load: `lobbies` pre-made #mp_ channels each
+    getting `rate` lines a second, and dropping every connection every
+    `disconnect_every` seconds. Load lines end with the server's
+    `time.perf_counter()` when they were sent, so a client in the same
+    process can measure latency.
+
+    Run from the repository root (then set "irc_host"/"irc_port" in configs.json):
+        python -m benchmarks.bancho [port] [lobbies] [rate]
+'''
+from itertools import count
+
+import asyncio
+import sys
+import time
+
+SERVER = "cho.ppy.sh"
+FIRST_LOBBY = 100_000_000
+
+class Client:
+    __slots__ = ("writer", "nick", "channels", "logged_in", "pongs")
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer             = writer
+        self.nick               = "*"
+        self.channels: set[str] = set()
+        self.logged_in          = False
+        self.pongs              = 0
+
+    def send(self, *lines: str):
+        self.writer.write("".join(line + "\r\n" for line in lines).encode("utf-8"))
+
+class FakeBancho:
+    def __init__(
+        self,
+        passwords: dict[str, str] | None = None,
+        lobbies: int = 0,
+        rate: float = 0,
+        disconnect_every: float | None = None,
+        ping_every: float | None = 30,
+        tick: float = 0.01
+    ) -> None:
+        self.passwords                          = passwords # None: any password is accepted
+        self.rate                               = rate
+        self.disconnect_every                   = disconnect_every
+        self.ping_every                         = ping_every
+        self.tick                               = tick
+        self.channels: set[str]                 = {"#osu", "#lobby"}
+        self.load_lobbies                       = [f"#mp_{FIRST_LOBBY + i}" for i in range(lobbies)]
+        self.channels.update(self.load_lobbies)
+        self.members: dict[str, set[Client]]    = {}
+        self.clients: set[Client]               = set()
+        self.ids                                = count(FIRST_LOBBY + lobbies)
+        self.server: asyncio.Server | None      = None
+        self._tasks: list[asyncio.Task]         = []
+
+        self.lines_sent                         = 0
+        self.received                           = 0
+        self.disconnects                        = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> tuple[str, int]:
+        self.server = await asyncio.start_server(self.handle, host, port)
+        loop = asyncio.get_running_loop()
+        if self.rate and self.load_lobbies:
+            self._tasks.append(loop.create_task(self.generate()))
+        if self.disconnect_every:
+            self._tasks.append(loop.create_task(self.disconnect_periodically()))
+        if self.ping_every:
+            self._tasks.append(loop.create_task(self.ping_periodically()))
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for client in list(self.clients):
+            client.writer.close()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = Client(writer)
+        self.clients.add(client)
+        password = ""
+        try:
+            while line := await reader.readline():
+                self.received += 1
+                command, _, rest = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+                match command:
+                    case "PASS":
+                        password = rest
+                    case "NICK":
+                        client.nick = rest
+                        if self.passwords is not None and self.passwords.get(rest) != password:
+                            client.send(f":{SERVER} 464 {rest} :Bad authentication token.")
+                            await writer.drain()
+                            return
+                        client.logged_in = True
+                        client.send(
+                            f":{SERVER} 001 {rest} :Welcome to the osu!Bancho.",
+                            f":{SERVER} 375 {rest} :-",
+                            f":{SERVER} 376 {rest} :-"
+                        )
+                    case "JOIN":
+                        for channel in rest.lstrip(":").split(","):
+                            self.join(client, channel)
+                    case "PART":
+                        channel = rest.lstrip(":")
+                        client.channels.discard(channel)
+                        self.members.get(channel, set()).discard(client)
+                        client.send(f":{client.nick}!cho@ppy.sh PART :{channel}")
+                    case "PRIVMSG":
+                        self.privmsg(client, rest)
+                    case "PONG":
+                        client.pongs += 1
+                    case "QUIT":
+                        return
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.drop(client)
+
+    def drop(self, client: Client):
+        self.clients.discard(client)
+        for channel in client.channels:
+            self.members.get(channel, set()).discard(client)
+        client.writer.close()
+
+    def join(self, client: Client, channel: str):
+        if channel not in self.channels:
+            client.send(f":{SERVER} 403 {client.nick} {channel} :No such channel {channel}")
+            return
+        client.channels.add(channel)
+        members = self.members.setdefault(channel, set())
+        members.add(client)
+        client.send(
+            f":{client.nick}!cho@ppy.sh JOIN :{channel}",
+            f":{SERVER} 332 {client.nick} {channel} :multiplayer game #{channel[4:]}" if channel.startswith("#mp_")
+                else f":{SERVER} 332 {client.nick} {channel} :{channel[1:]}",
+            f":{SERVER} 353 {client.nick} = {channel} :@BanchoBot " + " ".join(member.nick for member in members),
+            f":{SERVER} 366 {client.nick} {channel} :End of /NAMES list."
+        )
+
+    def privmsg(self, client: Client, rest: str):
+        target, _, text = rest.partition(" ")
+        text = text[1:] if text.startswith(":") else text
+        if target == "BanchoBot" and text.startswith("!mp make "):
+            title = text[9:]
+            channel = f"#mp_{next(self.ids)}"
+            self.channels.add(channel)
+            self.join(client, channel)
+            client.send(
+                f":BanchoBot!cho@ppy.sh PRIVMSG {client.nick} :Created the tournament match "
+                f"https://osu.ppy.sh/mp/{channel[4:]} {title}"
+            )
+            return
+        # relay to everyone else in the channel, like the real server
+        for member in self.members.get(target, ()):
+            if member is not client:
+                member.send(f":{client.nick}!cho@ppy.sh PRIVMSG {target} :{text}")
+
+    async def generate(self):
+        '''
+            `rate` lines a second in every load lobby, spread over ticks.
+        '''
+        seq = 0
+        owed = 0.0
+        while True:
+            await asyncio.sleep(self.tick)
+            owed += self.rate * self.tick
+            burst = int(owed)
+            owed -= burst
+            if not burst: continue
+            touched: set[Client] = set()
+            for channel in self.load_lobbies:
+                for member in self.members.get(channel, ()):
+                    for _ in range(burst):
+                        seq += 1
+                        member.send(
+                            f":Player_{seq % 16}!cho@ppy.sh PRIVMSG {channel} :load {seq} {time.perf_counter()}"
+                        )
+                    self.lines_sent += burst
+                    touched.add(member)
+            await asyncio.gather(*[member.writer.drain() for member in touched], return_exceptions=True)
+
+    async def disconnect_periodically(self):
+        while True:
+            await asyncio.sleep(self.disconnect_every)
+            for client in list(self.clients):
+                self.disconnects += 1
+                self.drop(client)
+
+    async def ping_periodically(self):
+        while True:
+            await asyncio.sleep(self.ping_every)
+            for client in list(self.clients):
+                if client.logged_in:
+                    client.send(f"PING {SERVER}")
+
+async def main(port: int, lobbies: int, rate: float):
+    bancho = FakeBancho(lobbies=lobbies, rate=rate)
+    host, port = await bancho.start("127.0.0.1", port)
+    print(f"fake bancho on {host}:{port}, {lobbies} load lobbies at {rate} lines/s each")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    try:
+        asyncio.run(main(
+            int(args[0]) if len(args) > 0 else 6667,
+            int(args[1]) if len(args) > 1 else 0,
+            float(args[2]) if len(args) > 2 else 0
+        ))
+    except KeyboardInterrupt:
+        pass
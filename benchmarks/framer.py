@@ -0,0 +1,100 @@
+'''
+    Line framing microbenchmark: the old chunk decode + str split path against
+    `IRC.Framer.LineFramer`.
+
+    Run from the repository root:
+        python -m benchmarks.framer
+'''
+from IRC.Framer import LineFramer
+from threading import Thread
+from typing import Iterable
+
+import random
+import socket
+import time
+
+CHUNK = 1024
+
+def make_traffic(lines: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    texts = [
+        "BanchoBot!cho@ppy.sh PRIVMSG #mp_114514 :Player_%d joined in slot %d.",
+        "Player_%d!cho@ppy.sh PRIVMSG #mp_114514 :glhf everyone %d",
+        "Player_%d!cho@ppy.sh PRIVMSG #mp_114514 :よろしくお願いします %d",
+        "Player_%d!cho@ppy.sh PRIVMSG #mp_114514 :잘 부탁드립니다 %d",
+    ]
+    out = []
+    for i in range(lines):
+        out.append(":" + rng.choice(texts) % (i % 16, i % 16) + "\r\n")
+    return "".join(out).encode("utf-8")
+
+def chunks(data: bytes) -> list[bytes]:
+    return [data[i:i + CHUNK] for i in range(0, len(data), CHUNK)]
+
+def old_path(parts: Iterable[bytes]) -> tuple[int, int]:
+    lines = errors = 0
+    remain = ""
+    for chunk in parts:
+        try:
+            response = remain + chunk.decode("utf-8")
+        except UnicodeDecodeError:
+            # the old recv loop reconnects here, the chunk is lost
+            errors += 1
+            continue
+        data = response.split("\n")
+        remain = data.pop()
+        lines += len(data)
+    return lines, errors
+
+def framer_path(parts: list[bytes]) -> tuple[int, int]:
+    framer = LineFramer()
+    lines = 0
+    for chunk in parts:
+        # what the transport does with recv_into
+        buffer = framer.get_buffer(len(chunk))
+        buffer[:len(chunk)] = chunk
+        lines += len(framer.buffer_updated(len(chunk)))
+    return lines, 0
+
+def serve(data: bytes) -> tuple[socket.socket, Thread]:
+    a, b = socket.socketpair()
+    writer = Thread(target=lambda: (a.sendall(data), a.close()))
+    writer.start()
+    return b, writer
+
+def socket_old(data: bytes) -> tuple[int, int]:
+    sock, writer = serve(data)
+    result = old_path(iter(lambda: sock.recv(CHUNK), b""))
+    writer.join()
+    sock.close()
+    return result
+
+def socket_framer(data: bytes) -> tuple[int, int]:
+    framer = LineFramer()
+    lines = 0
+    sock, writer = serve(data)
+    while n := sock.recv_into(framer.get_buffer()):
+        lines += len(framer.buffer_updated(n))
+    writer.join()
+    sock.close()
+    return lines, 0
+
+def bench(name: str, func, data, rounds: int = 5):
+    best = float("inf")
+    result = (0, 0)
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(data)
+        best = min(best, time.perf_counter() - start)
+    lines, errors = result
+    print(f"{name:<8} {best * 1000:8.2f} ms  {lines / best / 1e6:6.2f} M lines/s  lines={lines} decode_errors={errors}")
+
+if __name__ == "__main__":
+    data = make_traffic(200_000)
+    parts = chunks(data)
+    print(f"in memory, {len(parts)} chunks of {CHUNK} bytes")
+    bench("old", old_path, parts)
+    bench("framer", framer_path, parts)
+    print(f"over a socketpair, {len(data)} bytes (old: recv({CHUNK}), framer: recv_into)")
+    bench("old", socket_old, data)
+    bench("framer", socket_framer, data)
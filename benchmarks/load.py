@@ -0,0 +1,123 @@
+'''
+    End to end load test: `benchmarks.bancho.FakeBancho` pushing N lobbies at
+    M lines/s into a real `OsuSocket`/`IrcManager`, relayed the way the
+    Referee cog does it (subscribe, flush window, drain) into a stub discord
+    sink that records when every line arrives.
+
+    Reports delivered throughput, p50/p99/max latency from the fake server's
+    write to the sink, lines lost and reconnects.
+
+    Run from the repository root:
+        python -m benchmarks.load [lobbies] [lines/s per lobby] [seconds] [disconnect every s]
+'''
+from benchmarks.bancho import FakeBancho
+from IRC.OsuSocket import OsuSocket
+from IRC.Channel import Channel, StagedLine
+
+import asyncio
+import sys
+import time
+
+class StubSink:
+    '''
+        Stands in for the discord threads, takes ~`send_time` per message.
+    '''
+    def __init__(self, send_time: float = 0) -> None:
+        self.send_time              = send_time
+        self.latencies: list[float] = []
+        self.messages               = 0
+
+    async def send(self, lines: list[StagedLine]):
+        if self.send_time:
+            await asyncio.sleep(self.send_time)
+        now = time.perf_counter()
+        self.messages += 1
+        for _, _, text in lines:
+            # "load <seq> <sent at>"
+            self.latencies.append(now - float(text.rsplit(" ", 1)[1]))
+
+class Relay:
+    def __init__(self, socket: OsuSocket, sink: StubSink, flush_window: float) -> None:
+        self.socket                            = socket
+        self.sink                              = sink
+        self.flush_window                      = flush_window
+        self.wakeups: dict[str, asyncio.Event] = {}
+
+    def notify(self, chat: Channel):
+        wakeup = self.wakeups.get(chat.name)
+        if wakeup:
+            wakeup.set()
+
+    async def run(self, name: str):
+        wakeup = self.wakeups[name] = asyncio.Event()
+        self.socket.manager.subscribe(name, self.notify)
+        while True:
+            await wakeup.wait()
+            await asyncio.sleep(self.flush_window)
+            wakeup.clear()
+            messages = await self.socket.take_staged(name)
+            if messages:
+                await self.sink.send(list(messages))
+
+def percentile(values: list[float], q: float) -> float:
+    if not values: return float("nan")
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+async def run(
+    lobbies: int,
+    rate: float,
+    duration: float,
+    disconnect_every: float | None = None,
+    flush_window: float = 0.2,
+    send_time: float = 0
+) -> dict[str, float]:
+    bancho = FakeBancho(lobbies=lobbies, rate=rate, disconnect_every=disconnect_every)
+    host, port = await bancho.start()
+
+    socket = OsuSocket({"channel": (1e9, 1e9)}, host=host, port=port)
+    await socket.start_async("bench", "bench")
+    joined = await socket.join_many(bancho.load_lobbies)
+    if not all(joined.values()):
+        raise RuntimeError("failed to join the load lobbies")
+
+    sink = StubSink(send_time)
+    relay = Relay(socket, sink, flush_window)
+    relays = [asyncio.create_task(relay.run(name)) for name in bancho.load_lobbies]
+
+    started = time.perf_counter()
+    await asyncio.sleep(duration)
+    bancho.rate = 0 # let the pipeline drain
+    await asyncio.sleep(flush_window * 2 + send_time + 0.5)
+    elapsed = time.perf_counter() - started
+
+    for task in relays:
+        task.cancel()
+    socket.cleanup()
+    await bancho.stop()
+
+    latencies = sorted(sink.latencies)
+    dropped = sum(chat.staged_messages.dropped for chat in socket.manager.get_chat_list())
+    return {
+        "sent"       : bancho.lines_sent,
+        "delivered"  : len(latencies),
+        "lost"       : bancho.lines_sent - len(latencies),
+        "dropped"    : dropped,
+        "lines/s"    : len(latencies) / elapsed,
+        "messages"   : sink.messages,
+        "p50 ms"     : percentile(latencies, 0.5) * 1000,
+        "p99 ms"     : percentile(latencies, 0.99) * 1000,
+        "max ms"     : (latencies[-1] if latencies else float("nan")) * 1000,
+        "reconnects" : socket.reconnects,
+    }
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    lobbies = int(args[0]) if len(args) > 0 else 100
+    rate = float(args[1]) if len(args) > 1 else 10
+    duration = float(args[2]) if len(args) > 2 else 10
+    disconnect_every = float(args[3]) if len(args) > 3 else None
+    print(f"{lobbies} lobbies x {rate} lines/s for {duration}s" + (
+        f", dropping the connection every {disconnect_every}s" if disconnect_every else ""))
+    result = asyncio.run(run(lobbies, rate, duration, disconnect_every))
+    for key, value in result.items():
+        print(f"{key:<11} {value:,.2f}" if isinstance(value, float) else f"{key:<11} {value:,}")
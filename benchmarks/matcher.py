@@ -0,0 +1,109 @@
+'''
+    BanchoBot event matching benchmark: the old per-pattern `re.search` over
+    the formatted line against `IRC.Matcher.PatternMatcher`, on synthetic
+    traffic from a few hundred lobbies.
+
+    Run from the repository root:
+        python -m benchmarks.matcher [lobbies] [lines]
+'''
+from IRC.Matcher import PatternMatcher
+from IRC.Parser import parse
+
+import random
+import re
+import sys
+import time
+
+EVENTS = [
+    r"(.+) joined in slot (\d+)",
+    r"(.+) left the game\.$",
+    r"(.+) moved to slot (\d+)",
+    r"(.+) changed to (Red|Blue)",
+    r"(.+) finished playing \(Score: (\d+), (PASSED|FAILED)\)\.",
+    r"Beatmap changed to: (.+) \(https://osu\.ppy\.sh/b/(\d+)\)",
+    r"Changed beatmap to https://osu\.ppy\.sh/b/(\d+) (.+)",
+    r"All players are ready",
+    r"The match has started!",
+    r"The match has finished!",
+    r"(.+) became the host\.",
+    r"Changed match host to (.+)",
+    r"Closed the match",
+    r"Room name: (.+), History: https://osu\.ppy\.sh/mp/(\d+)",
+    r"Team mode: (\w+), Win condition: (\w+)",
+    r"Active mods: (.+)",
+    r"Players: (\d+)",
+    r"Slot (\d+) +(Ready|Not Ready) https://osu\.ppy\.sh/u/(\d+) (.+?) +(?:\[(.+)\])?$",
+    r"Countdown finished",
+    r"Aborted the match",
+]
+
+def make_traffic(lobbies: int, lines: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    bancho = [
+        "Player_{n} joined in slot {slot}.",
+        "Player_{n} left the game.",
+        "Player_{n} finished playing (Score: 812345, PASSED).",
+        "All players are ready",
+        "Beatmap changed to: Artist - Title [Insane] (https://osu.ppy.sh/b/{n}123)",
+        "Player_{n} moved to slot {slot}",
+    ]
+    chat = [
+        "gl hf",
+        "can we get a minute, my tablet disconnected",
+        "!mp timer 120",
+        "nice pass",
+    ]
+    out = []
+    for _ in range(lines):
+        mp = 100000 + rng.randrange(lobbies)
+        n = rng.randrange(16)
+        if rng.random() < 0.35:
+            text = rng.choice(bancho).format(n=n, slot=rng.randrange(1, 17))
+            out.append(f":BanchoBot!cho@ppy.sh PRIVMSG #mp_{mp} :{text}")
+        else:
+            out.append(f":Player_{n}!cho@ppy.sh PRIVMSG #mp_{mp} :{rng.choice(chat)}")
+    return out
+
+def legacy(messages, patterns: list[str]) -> int:
+    # the old Channel.update: search every pattern in the formatted line
+    hits = 0
+    listen = r"https://osu.ppy.sh/mp/(\d+)"
+    for data in messages:
+        message = "[%s] %s: %s" % ("12:00:00", data.sender, data.text)
+        if re.search(listen, message):
+            hits += 1
+        for pattern in patterns:
+            if re.search(pattern, message):
+                hits += 1
+                break
+    return hits
+
+def combined(messages, matcher: PatternMatcher) -> int:
+    hits = 0
+    for data in messages:
+        if data.sender == "BanchoBot" and matcher.match(data.text):
+            hits += 1
+    return hits
+
+def bench(name: str, func, *args, rounds: int = 3):
+    best = float("inf")
+    hits = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hits = func(*args)
+        best = min(best, time.perf_counter() - start)
+    count = len(args[0])
+    print(f"  {name:<9} {best / count * 1e9:7.0f} ns/line  hits={hits}")
+
+if __name__ == "__main__":
+    lobbies = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    messages = [parse(line) for line in make_traffic(lobbies, count)]
+    print(f"{lobbies} lobbies, {count} lines")
+    for size in (2, len(EVENTS)):
+        matcher = PatternMatcher()
+        for i, pattern in enumerate(EVENTS[:size]):
+            matcher.register(str(i), pattern, print)
+        print(f"{size} patterns")
+        bench("legacy", legacy, messages, ["BanchoBot: " + p for p in EVENTS[:size]])
+        bench("combined", combined, messages, matcher)
@@ -0,0 +1,120 @@
+'''
+    Parser benchmark: the old list[str] parser against `IRC.Parser.parse` on a
+    million Bancho lines, with the matching `IrcManager.update` dispatch.
+
+    Run from the repository root:
+        python -m benchmarks.parser [lines]
+'''
+from IRC.Parser import parse, ParsedMessage, MESSAGE, JOIN, NAMES, PART
+
+import gc
+import random
+import sys
+import time
+import tracemalloc
+
+def legacy_parse(message: str) -> list[str]:
+    message = message.strip()
+    if message == "": return []
+    data = message.split(":")
+    mData = data[1].split(" ")
+
+    retData = []
+    if not mData[1] == "QUIT":
+        match (mData[1]):
+            case "353":
+                retData += ["0", mData[4]] + data[2].split(" ")
+            case "JOIN":
+                retData += ["0", data[2], mData[0].split("!")[0]]
+            case "PRIVMSG":
+                retData += [
+                    "1",
+                    mData[2],
+                    mData[0].split("!")[0],
+                    ":".join(data[2: len(data)])
+                ]
+            case "PART":
+                retData += ["2", data[2], mData[0].split("!")[0]]
+    return retData
+
+def legacy_dispatch(data: list[str]) -> int:
+    match (data[0]):
+        case "0":
+            return len(data[2:len(data)])
+        case "1":
+            return len(data[3])
+        case "2":
+            return len(data[2])
+    return 0
+
+def dispatch(message: ParsedMessage) -> int:
+    kind = message.kind
+    if kind is MESSAGE:
+        return len(message.text)
+    elif kind is JOIN:
+        return 1
+    elif kind is NAMES:
+        return len(message.names)
+    elif kind is PART:
+        return len(message.sender)
+    return 0
+
+def make_traffic(lines: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    templates = [
+        (60, ":Player_{n}!cho@ppy.sh PRIVMSG #mp_{mp} :gl hf :) see you at 12:30"),
+        (25, ":BanchoBot!cho@ppy.sh PRIVMSG #mp_{mp} :Player_{n} finished playing (Score: 812345, PASSED)."),
+        (5,  ":Player_{n}!cho@ppy.sh JOIN :#mp_{mp}"),
+        (5,  ":Player_{n}!cho@ppy.sh PART :#mp_{mp}"),
+        (3,  ":cho.ppy.sh 353 referee = #mp_{mp} :@BanchoBot +referee Player_{n} Player_1 Player_2"),
+        (2,  ":Player_{n}!cho@ppy.sh QUIT :quit"),
+    ]
+    weights = [w for w, _ in templates]
+    choices = rng.choices([t for _, t in templates], weights, k=lines)
+    return [t.format(n=rng.randrange(64), mp=100000 + rng.randrange(300)) for t in choices]
+
+def run(lines: list[str], parser, dispatcher):
+    for line in lines:
+        message = parser(line)
+        if message:
+            dispatcher(message)
+
+def bench(parsers: dict[str, tuple], lines: list[str], rounds: int = 7):
+    # rounds alternate between the parsers, so drift on a noisy machine hits all of them alike
+    best = {name: [float("inf"), float("inf")] for name in parsers}
+    for _ in range(rounds):
+        for name, (parser, dispatcher) in parsers.items():
+            start = time.perf_counter()
+            for line in lines:
+                parser(line)
+            best[name][0] = min(best[name][0], time.perf_counter() - start)
+
+            start = time.perf_counter()
+            run(lines, parser, dispatcher)
+            best[name][1] = min(best[name][1], time.perf_counter() - start)
+
+    per_line = 1e9 / len(lines)
+    for name, (parser, _) in parsers.items():
+        # what every parsed message keeps alive until it is dropped
+        tracemalloc.start()
+        parsed = [parser(line) for line in lines[:100_000]]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del parsed
+
+        best_parse, best_total = best[name]
+        print(
+            f"{name:<8} parse {best_parse * per_line:6.0f} ns/line  "
+            f"parse+dispatch {best_total * per_line:6.0f} ns/line  "
+            f"{size / min(len(lines), 100_000):5.0f} B/message"
+        )
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    lines = make_traffic(count)
+    print(f"{count} lines, best of 7")
+    gc.freeze() # keep the recorded lines out of the collector's way
+    bench({
+        "legacy": (legacy_parse, legacy_dispatch),
+        "parse" : (parse, dispatch),
+    }, lines)
@@ -0,0 +1,140 @@
+'''
+    Replays a capture recorded with the "capture" setting (see `IRC.Capture`)
+    through the path live traffic takes: `parse`, `IrcManager.update`,
+    `Channel` staging and the lobby trackers. Optionally a stub discord sink
+    drains every chat each flush window, the way the relays do.
+
+    Reports throughput, per stage timing, how far the replay fell behind the
+    recording and the state the chats ended up in, so a match day can be run
+    again locally and compared between branches.
+
+    Run from the repository root:
+        python -m benchmarks.replay <capture> [speed: 1, N or max (default)] [sink send time s]
+'''
+from benchmarks.load import percentile
+from IRC.Capture import read_capture
+from IRC.IrcManager import IrcManager
+from IRC.Parser import parse, PING
+from IRC.Channel import format_line
+from IRC.Exceptions import NoSuchChannel
+
+import asyncio
+import sys
+import time
+
+# discord's limit on message content
+MESSAGE_LIMIT = 2000
+
+class StubSink:
+    '''
+        Drains every chat each `flush_window`, takes ~`send_time` per message.
+    '''
+    def __init__(self, manager: IrcManager, flush_window: float = 0.2, send_time: float = 0) -> None:
+        self.manager      = manager
+        self.flush_window = flush_window
+        self.send_time    = send_time
+        self.lines        = 0
+        self.messages     = 0
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_window)
+            await self.drain()
+
+    async def drain(self):
+        for chat in self.manager.get_chat_list():
+            lines = chat.get_staged_messages()
+            if not lines: continue
+            length = sum(len(format_line(line)) + 1 for line in lines)
+            messages = -(-length // MESSAGE_LIMIT)
+            self.lines += len(lines)
+            self.messages += messages
+            if self.send_time:
+                await asyncio.sleep(self.send_time * messages)
+
+async def replay(path: str, speed: float | None = None, send_time: float | None = None) -> dict[str, float]:
+    '''
+        `speed` None replays as fast as possible, `send_time` None leaves the sink out.
+    '''
+    manager = IrcManager()
+    sink = StubSink(manager, send_time=send_time) if send_time is not None else None
+    sink_task = asyncio.create_task(sink.run()) if sink else None
+    parse_times: list[float] = []
+    update_times: list[float] = []
+    batches = lines = 0
+    recorded = behind = 0.0
+
+    with open(path, "rb") as fp:
+        manager.nick, capture = read_capture(fp)
+        started = time.perf_counter()
+        for delta, batch in capture:
+            recorded += delta
+            if speed:
+                ahead = recorded / speed - (time.perf_counter() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+                else:
+                    behind = max(behind, -ahead)
+            elif sink:
+                await asyncio.sleep(0) # let the sink have a go between reads
+            batches += 1
+            lines += len(batch)
+            for line in batch:
+                parse_started = time.perf_counter()
+                try:
+                    message = parse(line)
+                except NoSuchChannel:
+                    continue
+                parsed = time.perf_counter()
+                parse_times.append(parsed - parse_started)
+                if not message or message.kind is PING: continue
+                manager.update(message)
+                update_times.append(time.perf_counter() - parsed)
+        elapsed = time.perf_counter() - started
+
+    if sink_task:
+        sink_task.cancel()
+        await sink.drain()
+
+    chats = manager.get_chat_list()
+    lobbies = [chat.lobby for chat in chats if chat.lobby is not None]
+    parse_times.sort()
+    update_times.sort()
+    result = {
+        "batches"        : batches,
+        "lines"          : lines,
+        "recorded s"     : recorded,
+        "elapsed s"      : elapsed,
+        "lines/s"        : lines / elapsed if elapsed else float("nan"),
+        "max behind s"   : behind,
+        "parse total s"  : sum(parse_times),
+        "parse p50 us"   : percentile(parse_times, 0.5) * 1e6,
+        "parse p99 us"   : percentile(parse_times, 0.99) * 1e6,
+        "update total s" : sum(update_times),
+        "update p50 us"  : percentile(update_times, 0.5) * 1e6,
+        "update p99 us"  : percentile(update_times, 0.99) * 1e6,
+        "chats"          : len(chats),
+        "users"          : sum(len(chat.users) for chat in chats),
+        "lobbies"        : len(lobbies),
+        "playing"        : sum(1 for lobby in lobbies if lobby.status == "playing"),
+        "closed"         : sum(1 for lobby in lobbies if lobby.status == "closed"),
+        "games"          : sum(lobby.games for lobby in lobbies),
+        "staged"         : sum(len(chat.staged_messages) for chat in chats),
+        "dropped"        : sum(chat.staged_messages.dropped for chat in chats),
+    }
+    if sink:
+        result["sink lines"] = sink.lines
+        result["sink messages"] = sink.messages
+    return result
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args:
+        sys.exit(__doc__)
+    speed = None if len(args) < 2 or args[1] == "max" else float(args[1])
+    send_time = float(args[2]) if len(args) > 2 else None
+    print(f"replaying {args[0]} at " + (f"{speed}x" if speed else "max speed") + (
+        f" into a sink taking {send_time}s per message" if send_time is not None else ""))
+    result = asyncio.run(replay(args[0], speed, send_time))
+    for key, value in result.items():
+        print(f"{key:<15} {value:,.2f}" if isinstance(value, float) else f"{key:<15} {value:,}")
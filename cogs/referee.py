@@ -1,101 +1,351 @@
 from discord import app_commands
 from discord.ext import commands
-from typing import Optional
-from IRC.OsuSocket import OsuSocket
-
-from IRC.IrcManager import ircManager
+from datetime import datetime
+from typing import Any, Literal, Optional, Sequence
+from IRC.Pool import OsuSocketPool
+from IRC.Channel import Channel, StagedLine, format_line
+from IRC.Buffer import OverflowPolicy
+from IRC.ChatLog import ChatLog
+from IRC.Utils import Handoff
+from IRC.Metrics import metrics, SIZE_BUCKETS
+from IRC.Profiler import Profiler, LagMonitor
+from .threads import ThreadIndex, to_name, pack_messages
+from .webhooks import WebhookDelivery
+from .scheduler import DeliveryScheduler, delivery_weight, MATCH_WEIGHT
 
 import discord
 import logging
 import asyncio
 import tempfile
+import os
+import gzip
+import csv
+import io
+import time
+import signal
+
+# BanchoBot's reply to `!mp make [title]`
+MP_MAKE_PATTERN = r"Created the tournament match https://osu\.ppy\.sh/mp/(\d+) (?P<key>.+)"
 
-# idk i think this is important somehow
-def to_name(thread_name: str) -> str:
-    return thread_name.split("-")[1]
+RELAY_LATENCY  = metrics.histogram("discord_relay_latency_seconds", "From a line being staged to its batch reaching discord")
+SEND_TIME      = metrics.histogram("discord_send_seconds", "Time for a single discord message send")
+RELAY_BATCH    = metrics.histogram("discord_relay_batch_lines", "Lines relayed per batch", SIZE_BUCKETS)
+MESSAGES_SENT  = metrics.counter("discord_messages_sent_total", "Discord messages sent by the relay")
+SEND_FAILURES  = metrics.counter("discord_send_failures_total", "Discord sends that failed")
 
 class Referee(commands.Cog):
-    def __init__(self, bot: commands.Bot, nick: str, passw: str, channel_id: int) -> None:
-        self.bot                          = bot
-        self.creds                        = (nick, passw)
-        self.channel_id                   = channel_id
-        self.logger                       = logging.getLogger('discord')
-        self.osu_socket                   = OsuSocket()
-        self.threads: set[discord.Thread] = set()
-
-    def get_thread_by_name(self, name: str) -> (discord.Thread | None):
-        for thread in self.threads:
-            if thread.name == name:
-                return thread
-        return None
-            
+    def __init__(
+        self,
+        bot: commands.Bot,
+        accounts: list[tuple[str, str]],
+        channel_id: int,
+        rate_limits: dict[str, tuple[float, float]] | None = None,
+        flush_window: float = 0.2,
+        buffer_size: int = 1000,
+        overflow_policy: str = "drop_oldest",
+        chat_log: dict[str, Any] | None = None,
+        irc_loop: str = "shared",
+        server: tuple[str, int] = ("irc.ppy.sh", 6667),
+        delivery: str = "bot",
+        webhooks_per_channel: int = 2,
+        delivery_concurrency: int = 4,
+        capture: str | None = None,
+        loop_lag_threshold: float | None = None
+    ) -> None:
+        self.bot                               = bot
+        self.channel_id                        = channel_id
+        self.flush_window                      = flush_window
+        # "shared": the IRC client runs on the bot's loop, "thread": on its own loop in a thread
+        self.irc_loop                          = irc_loop
+        # file to record raw osu!irc traffic to, for `benchmarks.replay`
+        self.capture                           = capture
+        # seconds a loop may be blocked before it is logged, None: not watched
+        self.loop_lag_threshold                = loop_lag_threshold
+        self.profiler: Profiler | None         = None
+        self.lag_monitor: LagMonitor | None    = None
+        self.handoff: Handoff | None           = None
+        self.started                           = False
+        self.logger                            = logging.getLogger('discord')
+        self.threads                           = ThreadIndex()
+        self.relays: dict[int, asyncio.Task]   = {}
+        self.wakeups: dict[str, asyncio.Event] = {}
+        # chat name -> when its oldest undelivered line was staged, only kept with metrics on
+        self.staged_since: dict[str, float]    = {}
+        # every send to discord takes a turn here, across all threads
+        self.scheduler                         = DeliveryScheduler(delivery_concurrency)
+        # "webhook": post as the IRC nick through webhooks, falling back to the bot, "bot": as the bot
+        self.webhooks                          = (
+            WebhookDelivery(bot, self.scheduler, webhooks_per_channel) if delivery == "webhook" else None
+        )
+
+        # `chat_log` holds ChatLog's keyword arguments, e.g. path and retention_days
+        self.chat_log   = ChatLog(**(chat_log or {}))
+        # one connection per account, lobbies are spread over them
+        self.osu_socket = OsuSocketPool(accounts, rate_limits, {
+            "buffer_size"    : buffer_size,
+            "overflow_policy": OverflowPolicy(overflow_policy),
+            "chat_log"       : self.chat_log
+        }, *server)
+        self.register_metrics()
+
+    @classmethod
+    def from_configs(cls, bot: commands.Bot, configs: dict[str, Any]) -> "Referee":
+        '''
+            The cog as set up in configs.json, shared by both entry points.
+        '''
+        # several osu! accounts spread the lobbies over several connections
+        accounts = [
+            (account["nick"], account["pass"])
+            for account in configs.get("accounts") or [{"nick": configs["nick"], "pass": configs["pass"]}]
+        ]
+        return cls(
+            bot,
+            accounts,
+            configs["irc_channel_id"],
+            rate_limits          = configs.get("rate_limits"),
+            flush_window         = configs.get("relay_flush_window", 0.2),
+            buffer_size          = configs.get("buffer_size", 1000),
+            overflow_policy      = configs.get("overflow_policy", "drop_oldest"),
+            chat_log             = configs.get("chat_log"),
+            irc_loop             = configs.get("irc_loop", "shared"),
+            server               = (configs.get("irc_host", "irc.ppy.sh"), configs.get("irc_port", 6667)),
+            delivery             = configs.get("delivery", "bot"),
+            webhooks_per_channel = configs.get("webhooks_per_channel", 2),
+            delivery_concurrency = configs.get("delivery_concurrency", 4),
+            capture              = configs.get("capture"),
+            loop_lag_threshold   = configs.get("loop_lag_threshold")
+        )
+
+    def register_metrics(self):
+        # read on scrape only
+        sockets = self.osu_socket.sockets
+        nicks = self.osu_socket.nicks
+        def per_account(read):
+            return lambda: {nicks[socket]: read(socket) for socket in sockets}
+
+        metrics.gauge("osu_irc_ready", "1 if the connection is logged in", per_account(
+            lambda socket: int(socket.state.name == "READY")), "account")
+        metrics.gauge("osu_irc_reconnects", "Reconnects since start", per_account(
+            lambda socket: socket.reconnects), "account")
+        metrics.gauge("osu_irc_send_queue_depth", "Lines waiting in the send queue", per_account(
+            lambda socket: len(socket.send_queue)), "account")
+        metrics.gauge("osu_irc_replay_dropped", "Lines dropped from the replay buffer while disconnected", per_account(
+            lambda socket: socket.replay_dropped), "account")
+        metrics.gauge("osu_irc_staged_lines", "Lines staged for relaying", per_account(
+            lambda socket: sum(len(chat.staged_messages) for chat in socket.manager.get_chat_list())), "account")
+        metrics.gauge("osu_irc_staged_dropped", "Lines dropped from full staging buffers", per_account(
+            lambda socket: sum(chat.staged_messages.dropped for chat in socket.manager.get_chat_list())), "account")
+        metrics.gauge("osu_irc_failovers", "Times chats were moved off a failed connection",
+            lambda: self.osu_socket.failovers)
+        metrics.gauge("chat_log_written_lines", "Lines committed to the chat log", lambda: self.chat_log.written)
+        metrics.gauge("chat_log_queue_depth", "Lines waiting for the chat log writer", lambda: self.chat_log.queue.qsize())
+        metrics.gauge("discord_relays", "Threads being relayed to", lambda: len(self.relays))
+        metrics.gauge("discord_sends_in_flight", "Discord sends in progress", lambda: self.scheduler.in_flight)
+        metrics.gauge("discord_sends_waiting", "Discord sends waiting for their turn", lambda: len(self.scheduler.waiting))
+
     @commands.Cog.listener()
     async def on_ready(self):
-        self.osu_socket.start(self.creds[0], self.creds[1])
-        del self.creds
+        # fired again after every gateway reconnect
+        if self.started: return
+        self.started = True
+        self.loop = asyncio.get_running_loop()
+        self.chat_log.start()
+        if self.capture:
+            self.osu_socket.start_capture(self.capture)
+        if self.irc_loop == "thread":
+            self.handoff = Handoff(self.loop, self.wake)
+            self.osu_socket.start()
+        else:
+            await self.osu_socket.start_async()
+        self.start_profiling()
         channel = self.bot.get_channel(self.channel_id)
         if not isinstance(channel, discord.TextChannel):
             self.logger.debug(f"ID {self.channel_id} is not a text channel")
         else:
             self.logger.info(f"Fetching all active threads in channel: {channel.name}")
-            for thread in channel.threads:
-                name = thread.name
-                if name.startswith("match-#mp_") or name.startswith("channel-#"):
-                    self.threads.add(thread)
-            self.logger.info(f"Found {len(self.threads)} threads")
-        self.thread_update_task = asyncio.create_task(self.update_threads())
+            threads = [
+                thread for thread in channel.threads
+                if thread.name.startswith("match-#mp_") or thread.name.startswith("channel-#")
+            ]
+            self.logger.info(f"Found {len(threads)} threads")
+            # avoid blocking when waiting to join the chats
+            asyncio.create_task(self.validate_threads(threads))
+
+    def start_profiling(self):
+        # the bot's loop, plus each connection's own loop when they run on threads
+        loops = {"discord": self.loop}
+        for socket in self.osu_socket.sockets:
+            if socket.loop:
+                loops[self.osu_socket.nicks[socket]] = socket.loop
+        self.profiler = Profiler(loops)
+        if self.loop_lag_threshold:
+            self.lag_monitor = LagMonitor(loops, self.loop_lag_threshold)
+            self.lag_monitor.start()
+            metrics.gauge("event_loop_lag_seconds", "How late the last heartbeat on each loop was",
+                lambda: dict(self.lag_monitor.lag), "loop")
+        try:
+            # `kill -USR1 <pid>` starts a sampling profile, the next one writes it to the working directory
+            self.loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.create_task(self.toggle_profile()))
+        except (AttributeError, NotImplementedError, RuntimeError):
+            pass # no SIGUSR1 on windows, or not on the main thread
+
+    async def toggle_profile(self):
+        if not self.profiler.running:
+            await self.profiler.start("sample")
+            return
+        filename, data = await self.profiler.stop()
+        await asyncio.to_thread(self.write_profile, filename, data)
+        self.logger.info(f"Profile written to {os.path.abspath(filename)}")
+
+    def write_profile(self, filename: str, data: bytes):
+        with open(filename, "wb") as file:
+            file.write(data)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.author == self.bot.user: return
+        # our own relayed lines when delivering through webhooks
+        if message.webhook_id: return
         channel = message.channel
         if not isinstance(channel, discord.Thread): return
-        if channel in self.threads:
-            if channel.archived:
-                try:
-                    self.threads.remove(channel)
-                    channel = await channel.edit(archived=False)
-                    self.threads.add(channel)   
-                except discord.Forbidden:
-                    self.logger.exception(f"Failed to unarchive thread {channel.name}, missing permissions")
-                    return
-                except discord.HTTPException as e:
-                    self.logger.exception(f"Failed to unarchive thread {channel.name}: {e}")
-                    return
-            await self.osu_socket.privmsg(to_name(channel.name), message.content)
+        name = self.threads.get_chat(channel.id)
+        if name is None: return
+        if channel.archived:
+            try:
+                channel = await channel.edit(archived=False)
+            except discord.Forbidden:
+                self.logger.exception(f"Failed to unarchive thread {channel.name}, missing permissions")
+                return
+            except discord.HTTPException as e:
+                self.logger.exception(f"Failed to unarchive thread {channel.name}: {e}")
+                return
+            self.track_thread(channel)
+        await self.osu_socket.privmsg(name, message.content)
     
+    @commands.Cog.listener()
+    async def on_thread_update(self, before: discord.Thread, after: discord.Thread):
+        if after.id not in self.threads: return
+        # archived threads are most likely disbanded matches, stop relaying but keep
+        # them indexed so a message in the thread brings it back
+        if after.archived:
+            self.pause_thread(after)
+        else:
+            self.track_thread(after)
+
+    @commands.Cog.listener()
+    async def on_thread_delete(self, thread: discord.Thread):
+        if thread.id in self.threads:
+            self.untrack_thread(thread)
+
     async def cog_unload(self):
-        if hasattr(self, "thread_update_task"):
-            self.thread_update_task.cancel()
-
-    async def update_threads(self):
-        while True:
-            for thread in self.threads.copy():
-                # assume that archived threads are disbanded matches
-                if thread.archived:
-                    self.threads.remove(thread)
-                    continue
-
-                chat = ircManager.get_chat(to_name(thread.name))
-                if chat:
-                    messages = chat.get_staged_messages()
-                    asyncio.create_task(self.send_messages_to_thread(thread, messages))
-                else:
-                    self.threads.remove(thread) # prevent concurrency issue
-                    # avoid blocking when waiting to join a chat
-                    asyncio.create_task(self.validate_thread(thread))
-            await asyncio.sleep(0.5)
-
-    async def validate_thread(self, thread: discord.Thread):
-        channel = await self.osu_socket.join(to_name(thread.name))
-        if channel:
-            self.threads.add(thread)
-
-    async def send_messages_to_thread(self, thread: discord.Thread, messages: list[str]):
-        tasks = []
-        for message in messages:
-            tasks.append(thread.send(message))
-        await asyncio.gather(*tasks, return_exceptions = True)
+        for thread in self.threads:
+            self.untrack_thread(thread)
+        if self.lag_monitor:
+            self.lag_monitor.stop()
+        if self.profiler and self.profiler.running:
+            await self.profiler.stop()
+        self.osu_socket.stop_capture()
+        await asyncio.to_thread(self.chat_log.stop)
+
+    def track_thread(self, thread: discord.Thread):
+        self.threads.add(thread)
+        if thread.id not in self.relays:
+            self.relays[thread.id] = asyncio.create_task(self.relay(thread.id))
+
+    def pause_thread(self, thread: discord.Thread):
+        self.threads.add(thread)
+        relay = self.relays.pop(thread.id, None)
+        if relay:
+            relay.cancel()
+
+    def untrack_thread(self, thread: discord.Thread):
+        self.pause_thread(thread)
+        self.threads.remove(thread.id)
+
+    def notify(self, chat: Channel):
+        # called on the IRC loop, from another thread unless the loop is shared
+        if metrics.enabled:
+            self.staged_since.setdefault(chat.name, time.perf_counter())
+        if self.handoff:
+            self.handoff.put(chat.name)
+        else:
+            self.wake(chat.name)
+
+    def wake(self, name: str):
+        wakeup = self.wakeups.get(name)
+        if wakeup:
+            wakeup.set()
+
+    async def relay(self, thread_id: int):
+        '''
+            Delivers a chat's messages to its thread whenever the chat reports new
+            ones, an idle thread just sits on its event.
+        '''
+        name = self.threads.get_chat(thread_id)
+        if name is None: return
+        wakeup = self.wakeups[name] = asyncio.Event()
+        self.osu_socket.subscribe(name, self.notify)
+        wakeup.set() # anything staged before we subscribed
+        try:
+            while True:
+                await wakeup.wait()
+                # give the rest of a burst (e.g. `!mp settings`) a moment to arrive, it goes out as one message
+                await asyncio.sleep(self.flush_window)
+                wakeup.clear()
+                # looked up every time, unarchiving swaps the thread object
+                thread = self.threads.get_thread(thread_id)
+                if not thread: return
+                try:
+                    staged_at = self.staged_since.pop(name, None)
+                    messages = await self.osu_socket.take_staged(name)
+                    if messages:
+                        await self.send_messages_to_thread(thread, messages, delivery_weight(name, messages))
+                        if metrics.enabled:
+                            RELAY_BATCH.observe(len(messages))
+                            if staged_at is not None:
+                                RELAY_LATENCY.observe(time.perf_counter() - staged_at)
+                except Exception as e:
+                    # one bad batch must not stop the thread from relaying for good
+                    self.logger.exception(f"Failed to relay {name} to thread {thread.name}: {e}")
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.osu_socket.unsubscribe(name)
+            if self.wakeups.get(name) is wakeup:
+                del self.wakeups[name]
+            # gone from `relays`, `track_thread` can start a new one
+            if self.relays.get(thread_id) is asyncio.current_task():
+                del self.relays[thread_id]
+
+    async def validate_threads(self, threads: list[discord.Thread]):
+        channels = await self.osu_socket.join_many([to_name(thread.name) for thread in threads])
+        for thread in threads:
+            if channels.get(to_name(thread.name)):
+                self.track_thread(thread)
+
+    async def send_messages_to_thread(self, thread: discord.Thread, messages: Sequence[StagedLine], weight: int = 1):
+        if self.webhooks:
+            delivered = await self.webhooks.send(thread, messages, weight)
+            if delivered == len(messages): return
+            messages = list(messages)[delivered:]
+        # one at a time, concurrent sends can land out of order
+        for message in pack_messages(map(format_line, messages)):
+            timed = metrics.enabled
+            try:
+                async with self.scheduler.turn(thread.id, weight):
+                    if timed: started = time.perf_counter()
+                    await thread.send(message)
+                if timed:
+                    SEND_TIME.observe(time.perf_counter() - started)
+                    MESSAGES_SENT.inc()
+            except discord.HTTPException as e:
+                if timed: SEND_FAILURES.inc()
+                self.logger.exception(f"Failed to relay messages to thread {thread.name}: {e}")
+
+    async def post(self, thread: discord.Thread, message: str, weight: int = MATCH_WEIGHT):
+        # a lobby's own messages wait their turn with its relayed chat, `/create-lobbies` posts to many threads at once
+        async with self.scheduler.turn(thread.id, weight):
+            await thread.send(message)
 
     async def create_thread(
         self,
@@ -107,7 +357,7 @@ class Referee(commands.Cog):
             await interaction.followup.send(message)
             original_response = await interaction.original_response()
             thread = await original_response.create_thread(name=name, auto_archive_duration=60)
-            self.threads.add(thread)
+            self.track_thread(thread)
             return thread
         except Exception as e:
             self.logger.exception(e)
@@ -129,10 +379,12 @@ class Referee(commands.Cog):
         player_ping   : Optional[str] = None
     ):
         await interaction.response.defer()
-        await self.osu_socket.privmsg("BanchoBot", make_command)
-        matches = await ircManager.listen_for_pattern(
-                "BanchoBot",
-                "https://osu.ppy.sh/mp/(\\d+)"
+        # correlate BanchoBot's reply by lobby title so parallel `!mp make`s don't steal each other's
+        title = make_command.split(" ", 2)[2].strip() if make_command.startswith("!mp make ") else None
+        matches = await self.osu_socket.create_lobby(
+                make_command,
+                MP_MAKE_PATTERN if title else "https://osu.ppy.sh/mp/(\\d+)",
+                key = title
             )
         if len(matches) < 1:
             await interaction.followup.send("Failed to create a tournament match")
@@ -149,12 +401,97 @@ class Referee(commands.Cog):
             await interaction.followup.send(player_ping)
         if lobby_settings:
             await self.osu_socket.privmsg(to_name(thread.name), lobby_settings)
-            await thread.send(lobby_settings)
+            await self.post(thread, lobby_settings)
     
+    async def open_lobby(
+        self,
+        channel: discord.TextChannel,
+        title: str,
+        lobby_settings: str | None,
+        timeout: float
+    ) -> tuple[bool, str]:
+        # the reply is matched to this request by its title
+        matches = await self.osu_socket.create_lobby(f"!mp make {title}", MP_MAKE_PATTERN, key=title, timeout=timeout)
+        if not matches:
+            return False, f"**{title}**: failed, no reply from BanchoBot"
+        url = f"https://osu.ppy.sh/mp/{matches[0]}"
+        try:
+            thread = await channel.create_thread(
+                name=f"match-#mp_{matches[0]}",
+                type=discord.ChannelType.public_thread,
+                auto_archive_duration=60
+            )
+        except discord.HTTPException as e:
+            self.logger.exception(f"Failed to create a thread for {url}: {e}")
+            return False, f"**{title}**: lobby created at <{url}> but its thread could not be created"
+        self.track_thread(thread)
+        await self.post(thread, f"Created match: {url} ({title})")
+        if lobby_settings:
+            await self.osu_socket.privmsg(f"#mp_{matches[0]}", lobby_settings)
+            await self.post(thread, lobby_settings)
+        return True, f"**{title}**: <{url}> {thread.mention}"
+
+    @app_commands.command(name="create-lobbies", description="Create several tournament lobbies at once")
+    @app_commands.describe(
+        titles         = "Lobby titles separated by ;, e.g. OWC: (USA) vs (JPN); OWC: (KOR) vs (GER)",
+        csv_file       = "A CSV file with a lobby title per row, optionally followed by its settings command",
+        lobby_settings = "Command sent to every lobby without its own settings, e.g. !mp set 2 3 16"
+    )
+    async def create_lobbies(
+        self,
+        interaction   : discord.Interaction,
+        titles        : Optional[str] = None,
+        csv_file      : Optional[discord.Attachment] = None,
+        lobby_settings: Optional[str] = None
+    ):
+        await interaction.response.defer()
+        lobbies: list[tuple[str, str | None]] = []
+        if titles:
+            lobbies += [(title.strip(), lobby_settings) for title in titles.split(";") if title.strip()]
+        if csv_file:
+            try:
+                rows = csv.reader(io.StringIO((await csv_file.read()).decode("utf-8-sig")))
+                for row in rows:
+                    if not row or not row[0].strip(): continue
+                    if not lobbies and row[0].strip().lower() in ("title", "name", "match"): continue # header
+                    settings = row[1].strip() if len(row) > 1 and row[1].strip() else lobby_settings
+                    lobbies.append((row[0].strip(), settings))
+            except (discord.HTTPException, UnicodeDecodeError, csv.Error) as e:
+                await interaction.followup.send(f"Failed to read the CSV file: {e}")
+                return
+
+        channel = interaction.channel
+        if not isinstance(channel, discord.TextChannel):
+            channel = self.bot.get_channel(self.channel_id)
+        if not lobbies or not isinstance(channel, discord.TextChannel):
+            await interaction.followup.send("Nothing to create, give lobby titles or a CSV file in a text channel")
+            return
+
+        # everything is queued at once, the send queue paces the `!mp make`s to BanchoBot's rate
+        # limit, so the later ones get longer to wait for their reply
+        timeout = 10 + len(lobbies)
+        results = await asyncio.gather(*[
+            self.open_lobby(channel, title, settings, timeout) for title, settings in lobbies
+        ], return_exceptions=True)
+
+        created = 0
+        lines: list[str] = []
+        for (title, _), result in zip(lobbies, results):
+            if isinstance(result, BaseException):
+                self.logger.error(f"Failed to create lobby {title}", exc_info=result)
+                lines.append(f"**{title}**: failed, {result}")
+                continue
+            ok, line = result
+            created += ok
+            lines.append(line)
+        summary = [f"Created {created}/{len(lobbies)} lobbies", *lines]
+        for message in pack_messages(summary):
+            await interaction.followup.send(message)
+
     @app_commands.command(name="join", description="Join an existing chat")
     async def join(self, interaction: discord.Interaction, name: str):
         await interaction.response.defer()
-        if self.get_thread_by_name(name):
+        if self.threads.get_thread_by_chat(name):
             await interaction.followup.send(f"Already joined chat *{name}*")
             return
 
@@ -176,10 +513,105 @@ class Referee(commands.Cog):
                 f"Creating new thread for chat *{name}*"
             )
 
-    @app_commands.command(name="export", description="Export chat log to a file (max 3000 messages)")
+    @app_commands.command(name="lobby", description="Show the current state of a match lobby")
+    @app_commands.describe(name = "The lobby, e.g. #mp_123456, defaults to this thread's")
+    async def lobby(self, interaction: discord.Interaction, name: Optional[str] = None):
+        if name is None and isinstance(interaction.channel, discord.Thread):
+            name = self.threads.get_chat(interaction.channel.id)
+        # on the IRC loop, which keeps changing the lobby
+        summary = await self.osu_socket.lobby_summary(name) if name else None
+        if not summary:
+            await interaction.response.send_message("Use this in a match thread or pass a joined #mp_ lobby", ephemeral=True)
+            return
+        # tracked from BanchoBot's lines as they came in, nothing is sent to bancho
+        await interaction.response.send_message(pack_messages(summary)[0])
+
+    @app_commands.command(name="search", description="Search the chat history of every osu! chat")
+    @app_commands.describe(
+        query  = "Words the line must contain",
+        chat   = "Only this chat, e.g. #mp_123456",
+        sender = "Only lines sent by this osu! user",
+        hours  = "Only the last N hours"
+    )
+    async def search(
+        self,
+        interaction: discord.Interaction,
+        query: str,
+        chat: Optional[str] = None,
+        sender: Optional[str] = None,
+        hours: Optional[float] = None
+    ):
+        await interaction.response.defer()
+        if not self.chat_log.searchable:
+            await interaction.followup.send("Search is not available, this sqlite has no full text search support")
+            return
+        since = time.time() - hours * 3600 if hours else None
+        try:
+            results = await asyncio.to_thread(self.chat_log.search, query, chat, sender, since)
+        except Exception as e:
+            self.logger.exception(f"Failed to search chat log: {e}")
+            await interaction.followup.send("Failed to search the chat log due to an error")
+            return
+        if not results:
+            await interaction.followup.send(f"No messages found for *{query}*")
+            return
+
+        lines = [
+            f"`{datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')}` **{channel}** {name}: {discord.utils.escape_markdown(text)}"
+            for channel, ts, name, text in results
+        ]
+        await interaction.followup.send(pack_messages(lines)[0])
+
+    def write_export(self, name: str, path: str, compress: bool) -> int:
+        # runs in a worker thread, the store is read straight into the file
+        self.chat_log.flush(timeout=5)
+        with (gzip.open(path, "wt", encoding="utf-8") if compress else open(path, "w", encoding="utf-8")) as file:
+            file.write(f"Chat log for {name}\n")
+            file.write("--- Start of chat log ---\n")
+            count = self.chat_log.export(name, file)
+            file.write("--- End of chat log ---")
+        return count
+
+    @app_commands.command(name="profile", description="Profile the bot for a while and upload the result (owner only)")
+    @app_commands.describe(
+        seconds = "How long to profile for",
+        mode    = "sample: collapsed stacks, cheap. cprofile: pstats, exact but slows the bot down"
+    )
+    async def profile(
+        self,
+        interaction: discord.Interaction,
+        seconds    : app_commands.Range[int, 1, 300] = 30,
+        mode       : Literal["sample", "cprofile"] = "sample"
+    ):
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message("Only the bot owner can profile the bot", ephemeral=True)
+            return
+        if not self.profiler:
+            await interaction.response.send_message("The bot hasn't finished starting up yet", ephemeral=True)
+            return
+        await interaction.response.defer()
+        try:
+            await self.profiler.start(mode)
+        except (RuntimeError, ValueError) as e:
+            await interaction.followup.send(f"Can't start profiling: {e}")
+            return
+        await asyncio.sleep(seconds)
+        filename, data = await self.profiler.stop()
+        try:
+            await interaction.followup.send(
+                f"{mode} profile of {seconds}s",
+                file=discord.File(fp=io.BytesIO(data), filename=filename)
+            )
+        except discord.HTTPException as e:
+            self.logger.exception(f"Failed to upload profile: {e}")
+            await asyncio.to_thread(self.write_profile, filename, data)
+            await interaction.followup.send(f"Failed to upload the profile, it was written to {filename} instead")
+
+    @app_commands.command(name="export", description="Export the full chat log of this thread to a file")
     async def export(
         self,
-        interaction: discord.Interaction
+        interaction: discord.Interaction,
+        compress: bool = False
     ):
         await interaction.response.defer()
         channel = interaction.channel
@@ -187,32 +619,20 @@ class Referee(commands.Cog):
             await interaction.followup.send("This command can only be used in a thread")
             return
         
-        name = channel.name
-        if not name.startswith("match-#mp_") and not name.startswith("channel-#"):
+        name = self.threads.get_chat(channel.id)
+        if name is None:
             await interaction.followup.send("This command can only be used in a match or channel thread")
             return
         
-        name = to_name(name)
+        filename = f"{name}.txt.gz" if compress else f"{name}.txt"
         try:
-            with tempfile.NamedTemporaryFile(mode='w+', encoding='utf-8', suffix='.txt', delete=True) as temp_file:
-                temp_file.write(f"Chat log for {name}\n")
-                temp_file.write("--- Start of chat log ---\n")
-                async for message in channel.history(limit=3000):
-                    if message.author == self.bot.user:
-                        temp_file.write(message.content + "\n")
-                    else:
-                        timestamp = message.created_at.strftime("%H:%M:%S")
-                        temp_file.write(f"[{timestamp}] {message.author.name}: {message.content}\n")
-                temp_file.write("--- End of chat log ---")
-                temp_file.flush()
-                temp_file.seek(0)
-                await interaction.followup.send(file=discord.File(fp=temp_file.name, filename=f"{name}.txt"))
-        except discord.Forbidden:
-            self.logger.exception(f"Failed to read messages in thread {channel.name}, missing permissions")
-            await interaction.followup.send("I don't have permissions to read messages in this thread")
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, filename)
+                await asyncio.to_thread(self.write_export, name, path, compress)
+                await interaction.followup.send(file=discord.File(fp=path, filename=filename))
         except discord.HTTPException as e:
-            self.logger.exception(f"Failed to retrieve channel history: {e}")
+            self.logger.exception(f"Failed to upload chat log: {e}")
             await interaction.followup.send("Failed to export chat log due to an error")
         except Exception as e:
             self.logger.exception(f"Unexpected error while exporting chat log: {e}")
-            await interaction.followup.send("An unexpected error occurred while exporting the chat log")
\ No newline at end of file
+            await interaction.followup.send("An unexpected error occurred while exporting the chat log")
@@ -0,0 +1,134 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Hashable, Iterable
+from IRC.Channel import StagedLine
+from IRC.Metrics import metrics
+
+import asyncio
+import time
+
+# sends allowed per route in a window of seconds, kept just under what discord
+# allows for a bot posting in one channel and for a single webhook
+ROUTE_LIMIT   = (5, 5.5)
+WEBHOOK_LIMIT = (5, 2.5)
+
+# match lobbies are served ahead of public channels, BanchoBot's lines ahead of player chat
+MATCH_WEIGHT    = 4
+CHANNEL_WEIGHT  = 1
+REFEREE_BOOST   = 2
+
+TURN_WAIT = metrics.histogram("discord_delivery_wait_seconds", "Time a discord send waited for its turn")
+
+def delivery_weight(name: str, lines: Iterable[StagedLine]) -> int:
+    base = MATCH_WEIGHT if name.startswith("#mp_") else CHANNEL_WEIGHT
+    return base * REFEREE_BOOST if any(sender == "BanchoBot" for _, sender, _ in lines) else base
+
+class Waiter:
+    __slots__ = ("route", "weight", "limit", "credit", "future")
+
+    def __init__(self, route: Hashable, weight: int, limit: tuple[int, float], future: asyncio.Future) -> None:
+        self.route  = route
+        self.weight = weight
+        self.limit  = limit
+        self.credit = 0
+        self.future = future
+
+class DeliveryScheduler:
+    '''
+        Hands out turns to send a discord message, shared by every relay.
+
+        At most `concurrency` sends are in flight. Waiting sends are picked by
+        smooth weighted round robin, so a busy lobby gets more turns than a
+        quiet one without anyone starving. Each route (a thread, or a webhook)
+        gets at most `limit` sends per window, a send that would go over it
+        waits here instead of running into a 429.
+    '''
+    def __init__(self, concurrency: int = 4, limit: tuple[int, float] = ROUTE_LIMIT) -> None:
+        self.concurrency                             = max(1, concurrency)
+        self.limit                                   = limit
+        self.in_flight                               = 0
+        self.waiting: list[Waiter]                   = []
+        # route -> when its sends in the current window started
+        self.sent: dict[Hashable, deque[float]]      = {}
+        self._timer: asyncio.TimerHandle | None      = None
+
+    def has_room(self, route: Hashable, limit: tuple[int, float], now: float) -> bool:
+        sent = self.sent.get(route)
+        if not sent: return True
+        count, window = limit
+        while sent and now - sent[0] >= window:
+            sent.popleft()
+        if not sent:
+            del self.sent[route]
+            return True
+        return len(sent) < count
+
+    def reopens_at(self, waiter: Waiter) -> float:
+        return self.sent[waiter.route][0] + waiter.limit[1]
+
+    def take(self, route: Hashable, now: float):
+        self.in_flight += 1
+        self.sent.setdefault(route, deque()).append(now)
+
+    @asynccontextmanager
+    async def turn(
+        self,
+        route: Hashable,
+        weight: int = CHANNEL_WEIGHT,
+        limit: tuple[int, float] | None = None
+    ) -> AsyncIterator[None]:
+        await self.acquire(route, weight, limit or self.limit)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, route: Hashable, weight: int, limit: tuple[int, float]):
+        now = time.monotonic()
+        if not self.waiting and self.in_flight < self.concurrency and self.has_room(route, limit, now):
+            self.take(route, now)
+            return
+        waiter = Waiter(route, weight, limit, asyncio.get_running_loop().create_future())
+        self.waiting.append(waiter)
+        self.dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self.waiting:
+                self.waiting.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # granted just before the cancel, hand the turn on
+                self.release()
+            raise
+        if metrics.enabled:
+            TURN_WAIT.observe(time.monotonic() - now)
+
+    def release(self):
+        self.in_flight -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        # a waiter cancelled since the last dispatch is still listed until its task
+        # resumes, a turn handed to it would be lost
+        self.waiting = [waiter for waiter in self.waiting if not waiter.future.done()]
+        while self.waiting and self.in_flight < self.concurrency:
+            now = time.monotonic()
+            ready = [waiter for waiter in self.waiting if self.has_room(waiter.route, waiter.limit, now)]
+            if not ready:
+                # every waiting route is at its limit, look again once the first one frees up
+                self._timer = asyncio.get_running_loop().call_later(
+                    min(map(self.reopens_at, self.waiting)) - now, self.dispatch
+                )
+                return
+            total = 0
+            for waiter in ready:
+                waiter.credit += waiter.weight
+                total += waiter.weight
+            chosen = max(ready, key=lambda waiter: waiter.credit)
+            chosen.credit -= total
+            self.waiting.remove(chosen)
+            self.take(chosen.route, now)
+            chosen.future.set_result(None)
@@ -0,0 +1,88 @@
+from typing import Iterable, Iterator
+
+import discord
+
+# idk i think this is important somehow
+def to_name(thread_name: str) -> str:
+    return thread_name.split("-")[1]
+
+# discord's limit on message content
+MESSAGE_LIMIT = 2000
+
+def pack_messages(lines: Iterable[str], limit: int = MESSAGE_LIMIT) -> list[str]:
+    '''
+        Packs consecutive lines into as few messages as possible, keeping their
+        order. A line longer than `limit` is split over several messages.
+    '''
+    return [message for message, _ in pack_counted(lines, limit)]
+
+def pack_counted(lines: Iterable[str], limit: int = MESSAGE_LIMIT) -> list[tuple[str, int]]:
+    '''
+        `pack_messages`, with how many lines each message completes. A split
+        line counts towards the message holding its last piece.
+    '''
+    packed: list[tuple[str, int]] = []
+    current: list[str] = []
+    length = 0
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                packed.append(("\n".join(current), len(current)))
+                current, length = [], 0
+            packed.append((line[:limit], 0))
+            line = line[limit:]
+        if current and length + 1 + len(line) > limit:
+            packed.append(("\n".join(current), len(current)))
+            current, length = [], 0
+        length += len(line) + (1 if current else 0)
+        current.append(line)
+    if current:
+        packed.append(("\n".join(current), len(current)))
+    return packed
+
+class ThreadIndex:
+    '''
+        IRC chat name <-> discord thread, both directions are a dict lookup.
+
+        Threads are stored by id rather than by object, discord.py hands out a
+        new Thread object on every edit (e.g. unarchiving) and `add` simply
+        replaces the old one.
+    '''
+    def __init__(self) -> None:
+        self.threads: dict[int, discord.Thread] = {}
+        self.chats: dict[str, int]              = {}
+        self.names: dict[int, str]              = {}
+
+    def __len__(self) -> int:
+        return len(self.threads)
+
+    def __contains__(self, thread_id: int) -> bool:
+        return thread_id in self.threads
+
+    def __iter__(self) -> Iterator[discord.Thread]:
+        return iter(list(self.threads.values()))
+
+    def add(self, thread: discord.Thread) -> str:
+        name = self.names.get(thread.id)
+        if name is None:
+            name = self.names[thread.id] = to_name(thread.name)
+            self.chats[name] = thread.id
+        self.threads[thread.id] = thread
+        return name
+
+    def remove(self, thread_id: int) -> (str | None):
+        self.threads.pop(thread_id, None)
+        name = self.names.pop(thread_id, None)
+        if name is not None and self.chats.get(name) == thread_id:
+            del self.chats[name]
+        return name
+
+    def get_thread(self, thread_id: int) -> (discord.Thread | None):
+        return self.threads.get(thread_id)
+
+    def get_chat(self, thread_id: int) -> (str | None):
+        return self.names.get(thread_id)
+
+    def get_thread_by_chat(self, name: str) -> (discord.Thread | None):
+        thread_id = self.chats.get(name)
+        return self.threads.get(thread_id) if thread_id is not None else None
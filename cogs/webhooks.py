@@ -0,0 +1,136 @@
+from discord.ext import commands
+from itertools import groupby
+from typing import Sequence
+from IRC.Channel import StagedLine
+from IRC.Metrics import metrics
+from .threads import pack_counted
+from .scheduler import DeliveryScheduler, WEBHOOK_LIMIT
+
+import discord
+import logging
+import asyncio
+import time
+
+WEBHOOK_SEND_TIME     = metrics.histogram("discord_webhook_send_seconds", "Time for a single webhook message send")
+WEBHOOK_MESSAGES_SENT = metrics.counter("discord_webhook_messages_sent_total", "Discord messages sent through webhooks")
+WEBHOOK_FAILURES      = metrics.counter("discord_webhook_failures_total", "Webhook sends that failed and fell back to the bot")
+
+# discord's limit on webhook usernames
+USERNAME_LIMIT = 80
+
+# seconds before webhooks are looked up again in a channel where that failed,
+# for missing permissions and for any other error
+FORBIDDEN_RETRY = 600
+FAILED_RETRY    = 60
+
+class WebhookDelivery:
+    '''
+        Posts relayed lines into threads through webhooks on their parent
+        channel, with the IRC nick as the username.
+
+        Each webhook has its own rate limit bucket, so `per_channel` of them
+        are made per parent channel and used in turn. Webhooks are fetched (or
+        created) once per parent and cached, so is a failure to do so for a
+        while. Whatever can't be posted, e.g. the bot lacks Manage Webhooks,
+        is handed back for the bot to send itself.
+    '''
+    def __init__(
+        self,
+        bot: commands.Bot,
+        scheduler: DeliveryScheduler,
+        per_channel: int = 2,
+        name: str = "osu! relay"
+    ) -> None:
+        self.bot                                        = bot
+        self.scheduler                                  = scheduler
+        self.per_channel                                = max(1, per_channel)
+        self.name                                       = name
+        self.logger                                     = logging.getLogger('discord')
+        self.webhooks: dict[int, list[discord.Webhook]] = {}
+        self.turns: dict[int, int]                      = {}
+        self.locks: dict[int, asyncio.Lock]             = {}
+        # parent channel -> when to try getting its webhooks again
+        self.failed: dict[int, float]                   = {}
+
+    async def get_webhooks(self, channel: discord.TextChannel) -> list[discord.Webhook]:
+        webhooks = self.webhooks.get(channel.id)
+        if webhooks is not None:
+            return webhooks
+        if time.monotonic() < self.failed.get(channel.id, 0):
+            return []
+        # several relays can miss the cache at once, only one of them fetches
+        async with self.locks.setdefault(channel.id, asyncio.Lock()):
+            if channel.id in self.webhooks:
+                return self.webhooks[channel.id]
+            if time.monotonic() < self.failed.get(channel.id, 0):
+                return []
+            webhooks = []
+            try:
+                webhooks = [
+                    webhook for webhook in await channel.webhooks()
+                    if webhook.token and webhook.user == self.bot.user
+                ][:self.per_channel]
+                while len(webhooks) < self.per_channel:
+                    webhooks.append(await channel.create_webhook(name=self.name))
+            except discord.Forbidden:
+                # e.g. allowed to list webhooks but not to create one, make do with what we got
+                if not webhooks:
+                    self.logger.warning(f"Missing permissions to manage webhooks in {channel.name}, relaying as the bot")
+                    self.failed[channel.id] = time.monotonic() + FORBIDDEN_RETRY
+                    return []
+            except discord.HTTPException as e:
+                # make do with what we got, one webhook is still its own bucket
+                self.logger.exception(f"Failed to set up webhooks in {channel.name}: {e}")
+                if not webhooks:
+                    self.failed[channel.id] = time.monotonic() + FAILED_RETRY
+                    return []
+            self.failed.pop(channel.id, None)
+            self.webhooks[channel.id] = webhooks
+            return webhooks
+
+    def next_webhook(self, channel_id: int, webhooks: list[discord.Webhook]) -> discord.Webhook:
+        turn = self.turns.get(channel_id, 0) % len(webhooks)
+        self.turns[channel_id] = turn + 1
+        return webhooks[turn]
+
+    async def send(self, thread: discord.Thread, lines: Sequence[StagedLine], weight: int = 1) -> int:
+        '''
+            Posts consecutive lines from the same sender as that sender, and
+            returns how many of `lines` went out. On a failure the rest, from
+            the first line not fully posted, is left to the caller.
+        '''
+        parent = thread.parent
+        if not isinstance(parent, discord.TextChannel):
+            return 0
+        # our own copy, a relay sharing the parent may drop the cached list meanwhile
+        webhooks = await self.get_webhooks(parent)
+        if not webhooks:
+            return 0
+        delivered = 0
+        for sender, run in groupby(lines, key=lambda line: line[1]):
+            for content, count in pack_counted(f"[{stamp}] {text}" for stamp, _, text in run):
+                timed = metrics.enabled
+                webhook = self.next_webhook(parent.id, webhooks)
+                try:
+                    # one at a time, like the bot's own sends, so the order holds
+                    async with self.scheduler.turn(webhook.id, weight, WEBHOOK_LIMIT):
+                        if timed: started = time.perf_counter()
+                        await webhook.send(
+                            content,
+                            username=sender[:USERNAME_LIMIT] or discord.utils.MISSING,
+                            thread=thread,
+                            allowed_mentions=discord.AllowedMentions.none()
+                        )
+                    if timed:
+                        WEBHOOK_SEND_TIME.observe(time.perf_counter() - started)
+                        WEBHOOK_MESSAGES_SENT.inc()
+                except discord.HTTPException as e:
+                    if timed: WEBHOOK_FAILURES.inc()
+                    if isinstance(e, discord.NotFound):
+                        # deleted by someone, fetched again for the next batch
+                        if self.webhooks.get(parent.id) is webhooks:
+                            del self.webhooks[parent.id]
+                    self.logger.warning(f"Webhook send to thread {thread.name} failed, relaying as the bot: {e}")
+                    return delivered
+                delivered += count
+        return delivered
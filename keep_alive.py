@@ -1,5 +1,6 @@
-from flask import Flask
+from flask import Flask, Response
 from threading import Thread
+from IRC.Metrics import metrics
 
 app = Flask('')
 
@@ -7,6 +8,12 @@ app = Flask('')
 def home():
     return "I'm alive"
 
+@app.route('/metrics')
+def prometheus_metrics():
+    if not metrics.enabled:
+        return Response("metrics are disabled\n", status=404, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 def run():
   app.run(host='0.0.0.0',port=8080)
 
@@ -0,0 +1,57 @@
+from IRC.ChatLog import ChatLog
+
+import os
+import sqlite3
+import time
+
+def pragma(path: str, name: str):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"PRAGMA {name}").fetchone()[0]
+    finally:
+        conn.close()
+
+def file_size(path: str) -> int:
+    return sum(os.path.getsize(name) for name in (path, path + "-wal") if os.path.exists(name))
+
+def test_new_log_is_incremental_and_wal(tmp_path):
+    path = str(tmp_path / "chatlog.db")
+    ChatLog(path)
+    assert pragma(path, "auto_vacuum") == 2
+    assert pragma(path, "journal_mode") == "wal"
+
+def test_existing_log_is_converted_once(tmp_path):
+    path = str(tmp_path / "chatlog.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, channel TEXT NOT NULL, ts REAL NOT NULL, sender TEXT NOT NULL, text TEXT NOT NULL)")
+    conn.execute("INSERT INTO messages (channel, ts, sender, text) VALUES ('#osu', 1, 'a', 'kept')")
+    conn.commit()
+    conn.close()
+    assert pragma(path, "auto_vacuum") == 0
+
+    log = ChatLog(path)
+    assert pragma(path, "auto_vacuum") == 2
+    assert [text for _, _, text in log.iter_channel("#osu")] == ["kept"]
+
+def test_prune_deletes_old_lines_and_shrinks_the_file(tmp_path):
+    path = str(tmp_path / "chatlog.db")
+    log = ChatLog(path, retention_days=1, prune_interval=3600)
+    old = time.time() - 2 * 86400
+    log.start()
+    for i in range(5000):
+        log.append("#mp_1", "someone", f"old line {i} " + "x" * 200, ts=old)
+    log.append("#mp_1", "someone", "new line")
+    assert log.flush(10)
+    log.stop()
+
+    conn = log.connect()
+    size = file_size(path)
+    log._prune(conn)
+    conn.close()
+
+    assert [text for _, _, text in log.iter_channel("#mp_1")] == ["new line"]
+    assert file_size(path) < size / 4
+    if log.searchable:
+        assert log.search("old") == []
+        assert [text for _, _, _, text in log.search("new")] == ["new line"]
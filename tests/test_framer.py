@@ -0,0 +1,66 @@
+from IRC.Framer import LineFramer, LineProtocol
+
+import asyncio
+import pytest
+
+def test_lines_split_over_reads():
+    framer = LineFramer()
+    assert framer.feed(b"PING :cho.ppy.sh\r\n:a!cho@ppy.sh PRIV") == ["PING :cho.ppy.sh"]
+    assert len(framer) == len(b":a!cho@ppy.sh PRIV")
+    assert framer.feed(b"MSG #osu :hi\r\n") == [":a!cho@ppy.sh PRIVMSG #osu :hi"]
+    assert len(framer) == 0
+
+def test_multibyte_character_split_between_reads():
+    data = ":a!cho@ppy.sh PRIVMSG #osu :こんにちは\r\n".encode("utf-8")
+    cut = data.index("ん".encode("utf-8")) + 1
+    framer = LineFramer()
+    assert framer.feed(data[:cut]) == []
+    assert framer.feed(data[cut:]) == [":a!cho@ppy.sh PRIVMSG #osu :こんにちは"]
+
+@pytest.mark.parametrize("data, lines", [
+    (b"a\nb\n", ["a", "b"]),
+    (b"a\r\nb\nc\r\n", ["a", "b", "c"]),
+    (b"\r\n\r\n", ["", ""]),
+    (b"no newline yet", []),
+])
+def test_line_endings(data, lines):
+    assert LineFramer().feed(data) == lines
+
+def test_buffer_is_compacted_and_grown():
+    framer = LineFramer(size=64, min_free=16)
+    lines = []
+    for i in range(100):
+        lines += framer.feed(f"line {i}\r\n".encode())
+    assert lines == [f"line {i}" for i in range(100)]
+    assert len(framer.buffer) == 64
+
+    long = b"x" * 1000
+    assert framer.feed(long[:500]) == []
+    assert framer.feed(long[500:] + b"\r\n") == ["x" * 1000]
+    assert len(framer.buffer) >= 1000
+
+def test_invalid_utf8_is_replaced():
+    assert LineFramer().feed(b"bad \xff byte\r\n") == ["bad � byte"]
+
+def test_protocol_pauses_reading_past_max_pending():
+    class Transport:
+        paused = False
+        def pause_reading(self): self.paused = True
+        def resume_reading(self): self.paused = False
+
+    async def main():
+        protocol = LineProtocol(max_pending=2)
+        transport = Transport()
+        protocol.connection_made(transport)
+        for line in (b"a\r\n", b"b\r\n", b"c\r\n"):
+            buffer = protocol.get_buffer(len(line))
+            buffer[:len(line)] = line
+            protocol.buffer_updated(len(line))
+        assert transport.paused
+        assert list(await protocol.read_lines()) == ["a", "b", "c"]
+        assert not transport.paused
+
+        protocol.connection_lost(None)
+        with pytest.raises(ConnectionResetError):
+            await protocol.read_lines()
+    asyncio.run(main())
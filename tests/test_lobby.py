@@ -0,0 +1,104 @@
+from IRC.IrcManager import IrcManager
+from IRC.Parser import parse
+
+import pytest
+
+def bancho(manager: IrcManager, *lines: str, chat: str = "#mp_1"):
+    for line in lines:
+        manager.update(parse(f":BanchoBot!cho@ppy.sh PRIVMSG {chat} :{line}"))
+
+@pytest.fixture
+def manager() -> IrcManager:
+    manager = IrcManager()
+    manager.nick = "referee"
+    manager.update(parse(":referee!cho@ppy.sh JOIN :#mp_1"))
+    return manager
+
+def test_settings_output_resyncs_the_lobby(manager):
+    bancho(manager,
+        "Room name: OWC: (USA) vs (JPN), History: https://osu.ppy.sh/mp/1",
+        "Beatmap: https://osu.ppy.sh/b/1234 Artist - Title [Insane]",
+        "Team mode: TeamVs, Win condition: ScoreV2",
+        "Active mods: HardRock, Freemod",
+        "Players: 2",
+        "Slot 1  Not Ready https://osu.ppy.sh/u/2 PlayerOne       [Host / Team Blue / Hidden]",
+        "Slot 2  Ready     https://osu.ppy.sh/u/3 Player Two      [Team Red]",
+    )
+    chat = manager.get_chat("#mp_1")
+    lobby = chat.lobby
+    assert lobby.room == "OWC: (USA) vs (JPN)"
+    assert (lobby.beatmap_id, lobby.beatmap) == (1234, "Artist - Title [Insane]")
+    assert (lobby.team_mode, lobby.win_condition) == ("TeamVs", "ScoreV2")
+    assert (lobby.mods, lobby.freemod) == ("HardRock", True)
+    one, two = lobby.slots[1], lobby.slots[2]
+    assert (one.name, one.team, one.host, one.ready) == ("PlayerOne", "Blue", True, False)
+    assert (two.name, two.team, two.host, two.ready) == ("Player Two", "Red", False, True)
+    assert {"PlayerOne", "Player Two"} <= chat.users
+
+def test_a_match_from_join_to_close(manager):
+    chat = manager.get_chat("#mp_1")
+    lobby = chat.lobby
+    bancho(manager,
+        "PlayerOne joined in slot 1 for team blue.",
+        "PlayerTwo joined in slot 2 for team red.",
+        "PlayerOne moved to slot 3",
+        "PlayerTwo changed to Blue",
+        "PlayerOne became the host.",
+        "Changed beatmap to https://osu.ppy.sh/b/42 Artist - Song [Hard]",
+        "Enabled HardRock, disabled FreeMod",
+    )
+    assert set(lobby.slots) == {2, 3}
+    assert lobby.slots[3].name == "PlayerOne" and lobby.slots[3].host
+    assert lobby.player("PlayerTwo").team == "Blue"
+    assert (lobby.beatmap_id, lobby.beatmap) == (42, "Artist - Song [Hard]")
+    assert (lobby.mods, lobby.freemod) == ("HardRock", False)
+    assert {"PlayerOne", "PlayerTwo"} <= chat.users
+
+    bancho(manager, "All players are ready")
+    assert lobby.all_ready and all(player.ready for player in lobby.players.values())
+    bancho(manager, "The match has started!")
+    assert lobby.status == "playing" and not lobby.all_ready
+    bancho(manager,
+        "PlayerOne finished playing (Score: 123456, PASSED).",
+        "PlayerTwo finished playing (Score: 654, FAILED).",
+        "The match has finished!",
+    )
+    assert (lobby.status, lobby.games) == ("idle", 1)
+    assert (lobby.player("PlayerOne").score, lobby.player("PlayerOne").passed) == (123456, True)
+    assert (lobby.player("PlayerTwo").score, lobby.player("PlayerTwo").passed) == (654, False)
+
+    bancho(manager, "The match has started!", "Aborted the match")
+    assert (lobby.status, lobby.games) == ("idle", 1)
+    assert lobby.player("PlayerOne").score is None
+
+    bancho(manager, "Beatmap changed to: Other - Map [Extra] (https://osu.ppy.sh/b/7)", "Cleared match host")
+    assert (lobby.beatmap_id, lobby.beatmap) == (7, "Other - Map [Extra]")
+    assert not any(player.host for player in lobby.players.values())
+    bancho(manager, "Changed match host to PlayerTwo")
+    assert lobby.player("PlayerTwo").host
+
+    bancho(manager, "PlayerTwo left the game.", "Closed the match")
+    assert "PlayerTwo" not in lobby.players and 2 not in lobby.slots
+    assert "PlayerTwo" not in chat.users
+    assert lobby.status == "closed"
+
+def test_summary(manager):
+    bancho(manager,
+        "Room name: test, History: https://osu.ppy.sh/mp/1",
+        "PlayerOne joined in slot 1 for team blue.",
+        "PlayerOne became the host.",
+    )
+    assert manager.get_chat("#mp_1").lobby.summary() == [
+        "**test** (idle), https://osu.ppy.sh/mp/1",
+        "Mods: None",
+        "Players: 1, games played: 0",
+        "` 1` PlayerOne (host, team Blue)",
+    ]
+
+def test_other_senders_and_channels_dont_change_lobbies(manager):
+    manager.update(parse(":someone!cho@ppy.sh PRIVMSG #mp_1 :The match has started!"))
+    assert manager.get_chat("#mp_1").lobby.status == "idle"
+    manager.update(parse(":referee!cho@ppy.sh JOIN :#osu"))
+    bancho(manager, "PlayerOne joined in slot 1.", chat="#osu")
+    assert manager.get_chat("#osu").lobby is None
+    assert "PlayerOne" in manager.get_chat("#osu").users
@@ -0,0 +1,39 @@
+from IRC.Matcher import PatternMatcher
+
+def test_finds_the_pattern_and_its_groups():
+    matcher = PatternMatcher()
+    ready = lambda: "ready"
+    joined = lambda nick, slot: ("joined", nick, slot)
+    matcher.register("ready", r"All players are ready", ready)
+    matcher.register("joined", r"(.+) joined in slot (\d+)\.", joined)
+    matcher.register("finished", r"The match has finished!", lambda: None)
+
+    assert matcher.match("All players are ready") == (ready, ())
+    assert matcher.match("player one joined in slot 3.") == (joined, ("player one", "3"))
+    assert matcher.match("player left the game.") is None
+
+def test_patterns_are_anchored_at_the_start():
+    matcher = PatternMatcher()
+    matcher.register("ready", r"All players are ready", lambda: None)
+    assert matcher.match("Not All players are ready") is None
+
+def test_nested_groups_dont_shift_later_patterns():
+    matcher = PatternMatcher()
+    first = lambda *groups: groups
+    second = lambda *groups: groups
+    matcher.register("first", r"Beatmap changed to: ((.+) \[(.+)\]) \((.+)\)", first)
+    matcher.register("second", r"Changed match host to (.+)", second)
+    assert matcher.match("Changed match host to someone") == (second, ("someone",))
+    assert matcher.match("Beatmap changed to: a [b] (url)") == (first, ("a [b]", "a", "b", "url"))
+
+def test_unregister():
+    matcher = PatternMatcher()
+    matcher.register("a", r"a", lambda: None)
+    matcher.register("b", r"b", lambda: None)
+    matcher.unregister("a")
+    matcher.unregister("missing")
+    assert len(matcher) == 1
+    assert matcher.match("a") is None
+    assert matcher.match("b") is not None
+    matcher.unregister("b")
+    assert matcher.match("b") is None
@@ -0,0 +1,152 @@
+from benchmarks.bancho import FakeBancho, Client
+from IRC.OsuSocket import OsuSocket, ConnectionState
+from IRC.Parser import parse
+
+import asyncio
+
+class RecordingBancho(FakeBancho):
+    # every JOIN and PRIVMSG a client sent, in order
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.log: list[tuple[Client, str]] = []
+
+    def join(self, client: Client, channel: str):
+        self.log.append((client, f"JOIN {channel}"))
+        super().join(client, channel)
+
+    def privmsg(self, client: Client, rest: str):
+        self.log.append((client, f"PRIVMSG {rest}"))
+        super().privmsg(client, rest)
+
+async def wait_for(condition, timeout: float = 5):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+def test_stopped_services_dont_leave_the_inflight_batch_behind():
+    async def main():
+        socket = OsuSocket()
+        socket.loop = asyncio.get_running_loop()
+        written = asyncio.Event()
+        async def write(data: bytes):
+            written.set()
+            await asyncio.Event().wait() # the connection hangs mid write
+
+        socket.write = write
+        socket.state = ConnectionState.READY
+        socket.send_queue.put("PRIVMSG #mp_1 :hello")
+        socket.send_queue.put("JOIN #mp_2")
+        socket.start_services(socket.flush_queue)
+        await written.wait()
+
+        await socket._stop_services()
+        socket._keep_unsent()
+        # the batch was put back when flush_queue was cancelled, and cleared with the rest
+        assert len(socket.send_queue) == 0
+        assert list(socket._replay) == ["PRIVMSG #mp_1 :hello"]
+    asyncio.run(main())
+
+def test_reconnect_rejoins_before_replaying_chat():
+    async def main():
+        bancho = RecordingBancho()
+        host, port = await bancho.start()
+        # one line a second, most of the chat is still queued when the connection drops
+        socket = OsuSocket({"channel": (1, 1)}, host=host, port=port)
+        await socket.start_async("me", "pass")
+        try:
+            assert await socket.join("#osu")
+            for i in range(5):
+                await socket.privmsg("#osu", f"line {i}")
+            await wait_for(lambda: any(line.startswith("PRIVMSG #osu") for _, line in bancho.log))
+
+            first = next(iter(bancho.clients))
+            bancho.drop(first)
+            await wait_for(lambda: socket.reconnects == 1 and socket.state is ConnectionState.READY)
+            await wait_for(lambda: sum(1 for client, line in bancho.log
+                if client is not first and line.startswith("PRIVMSG #osu")) >= 2)
+
+            after = [line for client, line in bancho.log if client is not first]
+            assert after.index("JOIN #osu") < next(i for i, line in enumerate(after) if line.startswith("PRIVMSG #osu"))
+            # nothing is sent twice: lines the old connection wrote aren't replayed
+            sent = [line for _, line in bancho.log if line.startswith("PRIVMSG #osu")]
+            assert len(sent) == len(set(sent))
+        finally:
+            socket.cleanup()
+            await bancho.stop()
+    asyncio.run(main())
+
+def test_wrong_password_raises():
+    async def main():
+        bancho = FakeBancho(passwords={"me": "right"})
+        host, port = await bancho.start()
+        socket = OsuSocket(host=host, port=port)
+        try:
+            await socket.start_async("me", "wrong")
+        except Exception as e:
+            assert type(e).__name__ == "OsuCredentialsIncorrect"
+        else:
+            raise AssertionError("logged in with the wrong password")
+        finally:
+            socket.cleanup()
+            await bancho.stop()
+    asyncio.run(main())
+
+def test_join_in_flight_is_resolved_by_the_rejoin():
+    class SwallowingBancho(FakeBancho):
+        swallow = True
+        def join(self, client: Client, channel: str):
+            if self.swallow:
+                self.swallow = False
+                return # the reply is lost with the connection
+            super().join(client, channel)
+
+    async def main():
+        bancho = SwallowingBancho()
+        host, port = await bancho.start()
+        socket = OsuSocket(host=host, port=port)
+        await socket.start_async("me", "pass")
+        try:
+            join = asyncio.create_task(socket.join("#osu", timeout=5))
+            await wait_for(lambda: not bancho.swallow)
+            bancho.drop(next(iter(bancho.clients)))
+            channel = await join
+            assert channel is not None and channel is socket.manager.get_chat("#osu")
+            assert not socket._joins
+        finally:
+            socket.cleanup()
+            await bancho.stop()
+    asyncio.run(main())
+
+def test_reconnect_keeps_the_chats():
+    async def main():
+        bancho = FakeBancho()
+        host, port = await bancho.start()
+        socket = OsuSocket(host=host, port=port)
+        await socket.start_async("me", "pass")
+        try:
+            chat = await socket.join("#osu")
+            socket.manager.update(parse(":BanchoBot!cho@ppy.sh PRIVMSG #osu :staged, not relayed yet"))
+            waiter = chat.expect("Created the tournament match")
+
+            bancho.drop(next(iter(bancho.clients)))
+            await wait_for(lambda: socket.reconnects == 1 and socket.state is ConnectionState.READY)
+
+            assert socket.manager.get_chat("#osu") is chat
+            assert "me" in chat.users
+            assert [text for _, _, text in chat.get_staged_messages()] == ["staged, not relayed yet"]
+            assert not waiter.done()
+        finally:
+            socket.cleanup()
+            await bancho.stop()
+    asyncio.run(main())
+
+def test_lobby_summary():
+    async def main():
+        socket = OsuSocket()
+        socket.manager.add_chat("#mp_1")
+        socket.manager.update(parse(":BanchoBot!cho@ppy.sh PRIVMSG #mp_1 :someone joined in slot 1."))
+        assert (await socket.lobby_summary("#mp_1"))[-1] == "` 1` someone"
+        socket.manager.add_chat("#osu")
+        assert await socket.lobby_summary("#osu") is None
+        assert await socket.lobby_summary("#mp_2") is None
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+from IRC.Parser import parse, ParsedMessage, MessageKind, JOIN, MESSAGE, PART, QUIT, NAMES, END_OF_NAMES, TOPIC, MODE, PING
+from IRC.Exceptions import NoSuchChannel
+
+import pytest
+
+@pytest.mark.parametrize("line, expected", [
+    (":Player_1!cho@ppy.sh PRIVMSG #mp_1 :gl hf :) see you at 12:30", (MESSAGE, "Player_1", "#mp_1", "gl hf :) see you at 12:30")),
+    (":Player_1!cho@ppy.sh PRIVMSG referee :hi", (MESSAGE, "Player_1", "referee", "hi")),
+    (":Player_1!cho@ppy.sh PRIVMSG #osu word", (MESSAGE, "Player_1", "#osu", "word")),
+    (":Player_1!cho@ppy.sh PRIVMSG #osu", (MESSAGE, "Player_1", "#osu", "")),
+    (":cho.ppy.sh PRIVMSG #osu :no bang", (MESSAGE, "cho.ppy.sh", "#osu", "no bang")),
+    (":Player_1!cho@ppy.sh JOIN :#mp_1", (JOIN, "Player_1", "#mp_1", "")),
+    (":Player_1!cho@ppy.sh PART :#mp_1", (PART, "Player_1", "#mp_1", "")),
+    (":Player_1!cho@ppy.sh QUIT :ping timeout 80s", (QUIT, "Player_1", "", "ping timeout 80s")),
+    (":BanchoBot!cho@ppy.sh MODE #mp_1 +v Player_1", (MODE, "BanchoBot", "#mp_1", "+v Player_1")),
+    (":cho.ppy.sh 332 me #mp_1 :multiplayer game #1", (TOPIC, "cho.ppy.sh", "#mp_1", "multiplayer game #1")),
+    (":cho.ppy.sh 353 me = #mp_1 :@BanchoBot +me Player_1", (NAMES, "cho.ppy.sh", "#mp_1", "@BanchoBot +me Player_1")),
+    (":cho.ppy.sh 366 me #mp_1 :End of /NAMES list.", (END_OF_NAMES, "cho.ppy.sh", "#mp_1", "")),
+    ("PING cho.ppy.sh", (PING, "", "", "cho.ppy.sh")),
+])
+def test_parse(line, expected):
+    assert parse(line) == expected
+
+@pytest.mark.parametrize("line", ["", "garbage", ":x", ":cho.ppy.sh 001 me :Welcome", ":cho.ppy.sh 376 me :-", ":cho.ppy.sh 353 me"])
+def test_ignored(line):
+    assert parse(line) is None
+
+def test_no_such_channel():
+    with pytest.raises(NoSuchChannel) as error:
+        parse(":cho.ppy.sh 403 me #mp_404 :No such channel #mp_404")
+    assert error.value.message == "#mp_404"
+
+def test_fields_and_names():
+    message = parse(":cho.ppy.sh 353 me = #mp_1 :@BanchoBot +me Player_1")
+    assert isinstance(message, ParsedMessage)
+    assert message.kind is MessageKind.NAMES
+    assert (message.sender, message.channel) == ("cho.ppy.sh", "#mp_1")
+    assert message.names == ["BanchoBot", "me", "Player_1"]
+
+def test_repr_follows_the_tuple_layout():
+    message = parse(":Player_1!cho@ppy.sh PRIVMSG #mp_1 :hi")
+    assert repr(message) == "ParsedMessage(MESSAGE, 'Player_1', '#mp_1', 'hi')"
@@ -0,0 +1,77 @@
+from benchmarks.bancho import FakeBancho
+from IRC.OsuSocket import ConnectionState
+from IRC.Pool import OsuSocketPool
+
+import IRC.Pool
+import asyncio
+
+async def wait_for(condition, timeout: float = 5):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+def test_chats_move_off_a_connection_that_gave_up(monkeypatch):
+    monkeypatch.setattr(IRC.Pool, "FAILOVER_INTERVAL", 0.05)
+    async def main():
+        bancho = FakeBancho(passwords={"first": "a", "second": "b"})
+        host, port = await bancho.start()
+        pool = OsuSocketPool([("first", "a"), ("second", "b")], host=host, port=port)
+        await pool.start_async()
+        try:
+            first, second = pool.sockets
+            assert await pool.join("#osu")
+            dead = pool.routes["#osu"]
+            alive = second if dead is first else first
+
+            # the password is revoked, the reconnect is refused with a 464
+            bancho.passwords[pool.nicks[dead]] = "revoked"
+            bancho.drop(next(client for client in bancho.clients if client.nick == pool.nicks[dead]))
+            await wait_for(lambda: dead.gave_up)
+            await pool.privmsg("#osu", "sent while down")
+
+            await wait_for(lambda: pool.routes["#osu"] is alive and pool.failovers == 1)
+            assert alive.manager.get_chat("#osu")
+            assert not dead._replay
+            listener = next(client for client in bancho.clients if client.nick == pool.nicks[alive])
+            assert "#osu" in listener.channels
+        finally:
+            pool.cleanup()
+            await bancho.stop()
+    asyncio.run(main())
+
+def test_a_reconnecting_connection_keeps_its_chats(monkeypatch):
+    monkeypatch.setattr(IRC.Pool, "FAILOVER_INTERVAL", 0.05)
+    async def main():
+        bancho = FakeBancho()
+        host, port = await bancho.start()
+        pool = OsuSocketPool([("first", "a"), ("second", "b")], host=host, port=port)
+        await pool.start_async()
+        try:
+            assert await pool.join("#osu")
+            socket = pool.routes["#osu"]
+            bancho.drop(next(client for client in bancho.clients if client.nick == pool.nicks[socket]))
+            await wait_for(lambda: socket.reconnects == 1 and socket.state is ConnectionState.READY)
+            await asyncio.sleep(0.1)
+            assert pool.routes["#osu"] is socket
+            assert pool.failovers == 0
+        finally:
+            pool.cleanup()
+            await bancho.stop()
+    asyncio.run(main())
+
+def test_watch_outlives_a_failing_fail_over(monkeypatch):
+    monkeypatch.setattr(IRC.Pool, "FAILOVER_INTERVAL", 0.01)
+    async def main():
+        pool = OsuSocketPool([("first", "a"), ("second", "b")])
+        pool.sockets[0].state = ConnectionState.BACKOFF
+        calls = 0
+        async def fail_over(socket):
+            nonlocal calls
+            calls += 1
+            raise RuntimeError("join_many failed")
+        pool.fail_over = fail_over
+        watch = asyncio.create_task(pool.watch())
+        await wait_for(lambda: calls >= 3)
+        assert not watch.done()
+        watch.cancel()
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+from IRC.Profiler import Profiler
+
+import IRC.Profiler
+import asyncio
+import cProfile
+import marshal
+import pytest
+import threading
+
+@pytest.fixture
+def thread_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+def busy():
+    return sum(i * i for i in range(10000))
+
+def test_cprofile_over_two_loops(thread_loop):
+    async def main():
+        profiler = Profiler({"bot": asyncio.get_running_loop(), "irc": thread_loop})
+        await profiler.start("cprofile")
+        busy()
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(asyncio.to_thread(busy), thread_loop))
+        filename, data = await profiler.stop()
+        assert filename.endswith(".pstats")
+        stats = marshal.loads(data)
+        assert any(name == "busy" for _, _, name in stats)
+        assert not profiler.running
+    asyncio.run(main())
+
+def test_a_failing_enable_doesnt_leave_the_profile_running(thread_loop, monkeypatch):
+    class OneAtATime(cProfile.Profile):
+        active = 0
+        def enable(self):
+            if OneAtATime.active:
+                raise ValueError("Another profiling tool is already active")
+            OneAtATime.active += 1
+            super().enable()
+        def disable(self):
+            OneAtATime.active = max(0, OneAtATime.active - 1)
+            super().disable()
+
+    monkeypatch.setattr(IRC.Profiler, "PER_INTERPRETER", False)
+    monkeypatch.setattr(IRC.Profiler.cProfile, "Profile", OneAtATime)
+    async def main():
+        profiler = Profiler({"bot": asyncio.get_running_loop(), "irc": thread_loop})
+        with pytest.raises(ValueError):
+            await asyncio.wait_for(profiler.start("cprofile"), 5)
+        assert not profiler.running
+        assert OneAtATime.active == 0
+        # the next one starts normally
+        await profiler.start("sample")
+        await asyncio.sleep(0.05)
+        filename, _ = await profiler.stop()
+        assert filename.endswith(".collapsed.txt")
+    asyncio.run(main())
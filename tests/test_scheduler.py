@@ -0,0 +1,91 @@
+from cogs.scheduler import DeliveryScheduler, delivery_weight, MATCH_WEIGHT, CHANNEL_WEIGHT, REFEREE_BOOST
+
+import asyncio
+import time
+
+def test_delivery_weight():
+    assert delivery_weight("#osu", [(0, "someone", "hi")]) == CHANNEL_WEIGHT
+    assert delivery_weight("#mp_1", [(0, "someone", "hi")]) == MATCH_WEIGHT
+    assert delivery_weight("#mp_1", [(0, "someone", "hi"), (0, "BanchoBot", "All players are ready")]) == MATCH_WEIGHT * REFEREE_BOOST
+
+def test_cancelled_waiter_doesnt_get_the_turn():
+    async def main():
+        scheduler = DeliveryScheduler(concurrency=1, limit=(100, 1))
+        order: list[str] = []
+        async def send(name: str):
+            async with scheduler.turn(name):
+                order.append(name)
+
+        await scheduler.acquire("holder", 1, scheduler.limit)
+        cancelled = asyncio.create_task(send("cancelled"))
+        waiting = asyncio.create_task(send("waiting"))
+        await asyncio.sleep(0)
+        assert len(scheduler.waiting) == 2
+
+        # cancelled but not resumed yet, its waiter is still listed when the turn frees up
+        cancelled.cancel()
+        scheduler.release()
+        await asyncio.gather(cancelled, waiting, return_exceptions=True)
+
+        assert cancelled.cancelled()
+        assert order == ["waiting"]
+        assert scheduler.in_flight == 0
+        assert not scheduler.waiting
+    asyncio.run(main())
+
+def test_cancelled_after_grant_hands_the_turn_on():
+    async def main():
+        scheduler = DeliveryScheduler(concurrency=1, limit=(100, 1))
+        order: list[str] = []
+        async def send(name: str):
+            async with scheduler.turn(name):
+                order.append(name)
+
+        await scheduler.acquire("holder", 1, scheduler.limit)
+        granted = asyncio.create_task(send("granted"))
+        waiting = asyncio.create_task(send("waiting"))
+        await asyncio.sleep(0)
+        scheduler.release() # grants "granted", which is cancelled before it runs
+        granted.cancel()
+        await asyncio.gather(granted, waiting, return_exceptions=True)
+
+        assert order == ["waiting"]
+        assert scheduler.in_flight == 0
+    asyncio.run(main())
+
+def test_heavier_routes_get_more_turns():
+    async def main():
+        scheduler = DeliveryScheduler(concurrency=1, limit=(100, 1))
+        order: list[str] = []
+        async def send(name: str, weight: int):
+            async with scheduler.turn(name, weight):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        await scheduler.acquire("holder", 1, scheduler.limit)
+        tasks = [asyncio.create_task(send(name, weight)) for name, weight in [("heavy", 3), ("light", 1)] for _ in range(4)]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+        # heavy sends go first on the whole, light ones still get through
+        positions = {name: sum(i for i, other in enumerate(order) if other == name) for name in ("heavy", "light")}
+        assert order[0] == "heavy"
+        assert positions["heavy"] < positions["light"]
+        assert order.count("light") == 4
+        assert scheduler.in_flight == 0
+    asyncio.run(main())
+
+def test_route_limit_holds_sends_back():
+    async def main():
+        scheduler = DeliveryScheduler(concurrency=4, limit=(2, 0.2))
+        started: list[float] = []
+        async def send():
+            async with scheduler.turn("thread"):
+                started.append(time.monotonic())
+
+        await asyncio.gather(*(send() for _ in range(4)))
+        assert started[2] - started[0] >= 0.19
+        assert started[3] - started[1] >= 0.19
+        assert scheduler.in_flight == 0
+    asyncio.run(main())
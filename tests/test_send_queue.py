@@ -0,0 +1,84 @@
+from IRC.SendQueue import SendQueue, TokenBucket, Priority, classify
+
+import asyncio
+import pytest
+
+@pytest.mark.parametrize("message, expected", [
+    ("PONG cho.ppy.sh", (Priority.HIGH, None)),
+    ("JOIN #mp_1", (Priority.HIGH, None)),
+    ("PRIVMSG #mp_1 :hello", (Priority.NORMAL, "channel")),
+    ("PRIVMSG #mp_1 !mp start 10", (Priority.HIGH, "channel")),
+    ("PRIVMSG BanchoBot !mp make test", (Priority.HIGH, "bancho")),
+    ("PRIVMSG someone :hi", (Priority.NORMAL, "dm")),
+])
+def test_classify(message, expected):
+    assert classify(message) == expected
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, capacity=2)
+    now = bucket.updated
+    assert bucket.try_consume(now)
+    assert bucket.try_consume(now)
+    assert not bucket.try_consume(now)
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert bucket.try_consume(now + 0.5)
+
+def test_high_priority_goes_first_and_lanes_keep_their_order():
+    queue = SendQueue()
+    for i in range(3):
+        queue.put(f"PRIVMSG #osu :chat {i}")
+    queue.put("JOIN #mp_1")
+    queue.put("PRIVMSG #mp_1 !mp settings")
+    batch = queue._take_batch(queue.buckets["channel"].updated)
+    lines = [entry.data.decode() for entry in batch]
+    assert lines == ["JOIN #mp_1\n", "PRIVMSG #mp_1 !mp settings\n", *(f"PRIVMSG #osu :chat {i}\n" for i in range(3))]
+    assert len(queue) == 0
+
+def test_rate_limit_holds_back_chat_but_not_housekeeping():
+    queue = SendQueue({"channel": (1, 2)})
+    for i in range(5):
+        queue.put(f"PRIVMSG #osu :chat {i}")
+    queue.put("PONG cho.ppy.sh")
+    now = queue.buckets["channel"].updated
+    batch = queue._take_batch(now)
+    assert [entry.data for entry in batch] == [b"PONG cho.ppy.sh\n", b"PRIVMSG #osu :chat 0\n", b"PRIVMSG #osu :chat 1\n"]
+    assert len(queue) == 3
+    assert queue._next_delay(now) == pytest.approx(1)
+
+def test_failed_write_puts_the_batch_back_in_order():
+    async def main():
+        queue = SendQueue()
+        for i in range(3):
+            queue.put(f"PRIVMSG #osu :chat {i}")
+        async def write(data: bytes):
+            queue.put("PRIVMSG #osu :queued meanwhile")
+            raise ConnectionResetError
+
+        with pytest.raises(ConnectionResetError):
+            await queue.run(write)
+        assert [entry.data.decode() for entry in queue.clear()] == [
+            *(f"PRIVMSG #osu :chat {i}\n" for i in range(3)), "PRIVMSG #osu :queued meanwhile\n"
+        ]
+        assert len(queue) == 0
+    asyncio.run(main())
+
+def test_run_coalesces_and_waits_for_tokens():
+    async def main():
+        queue = SendQueue({"channel": (20, 2)})
+        writes: list[bytes] = []
+        done = asyncio.Event()
+        async def write(data: bytes):
+            writes.append(data)
+            if b"chat 3" in data:
+                done.set()
+
+        for i in range(4):
+            queue.put(f"PRIVMSG #osu :chat {i}")
+        task = asyncio.create_task(queue.run(write))
+        await asyncio.wait_for(done.wait(), 1)
+        task.cancel()
+
+        assert writes[0] == b"PRIVMSG #osu :chat 0\nPRIVMSG #osu :chat 1\n"
+        assert b"".join(writes) == b"".join(f"PRIVMSG #osu :chat {i}\n".encode() for i in range(4))
+        assert queue.stats()["sent"] == 4
+    asyncio.run(main())
@@ -0,0 +1,14 @@
+import pytest
+
+pytest.importorskip("discord")
+
+from cogs.threads import pack_messages, pack_counted
+
+def test_pack_messages_keeps_lines_whole_and_in_order():
+    lines = [f"line {i}" for i in range(10)]
+    assert pack_messages(lines, limit=20) == ["line 0\nline 1\nline 2", "line 3\nline 4\nline 5", "line 6\nline 7\nline 8", "line 9"]
+
+def test_pack_counted_counts_completed_lines():
+    packed = pack_counted(["a" * 5, "b" * 25, "c" * 3], limit=10)
+    assert packed == [("aaaaa", 1), ("b" * 10, 0), ("b" * 10, 0), ("bbbbb\nccc", 2)]
+    assert [message for message, _ in packed] == pack_messages(["a" * 5, "b" * 25, "c" * 3], limit=10)
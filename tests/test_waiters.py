@@ -0,0 +1,58 @@
+from IRC.Waiters import WaiterRegistry
+
+import asyncio
+
+MP_MAKE = r"Created the tournament match https://osu\.ppy\.sh/mp/(\d+) (?P<key>.+)"
+
+def test_keyed_waiters_get_their_own_reply():
+    async def main():
+        waiters = WaiterRegistry()
+        first = waiters.expect(MP_MAKE, "OWC: (USA) vs (JPN)")
+        second = waiters.expect(MP_MAKE, "OWC: (KOR) vs (GER)")
+        # replies in the opposite order
+        assert waiters.dispatch("Created the tournament match https://osu.ppy.sh/mp/2 OWC: (KOR) vs (GER)") == 1
+        assert waiters.dispatch("Created the tournament match https://osu.ppy.sh/mp/1 OWC: (USA) vs (JPN)") == 1
+        assert first.result() == ("1", "OWC: (USA) vs (JPN)")
+        assert second.result() == ("2", "OWC: (KOR) vs (GER)")
+        assert len(waiters) == 0
+    asyncio.run(main())
+
+def test_unmatched_key_falls_back_to_the_oldest_unkeyed_waiter():
+    async def main():
+        waiters = WaiterRegistry()
+        keyed = waiters.expect(MP_MAKE, "other")
+        oldest = waiters.expect(MP_MAKE)
+        newest = waiters.expect(MP_MAKE)
+        assert waiters.dispatch("Created the tournament match https://osu.ppy.sh/mp/3 title") == 1
+        assert oldest.result() == ("3", "title")
+        assert not keyed.done() and not newest.done()
+    asyncio.run(main())
+
+def test_one_line_wakes_one_waiter_per_pattern():
+    async def main():
+        waiters = WaiterRegistry()
+        ready = [waiters.expect("All players are ready") for _ in range(2)]
+        anything = waiters.expect("(.+)")
+        assert waiters.dispatch("All players are ready") == 2
+        assert ready[0].done() and not ready[1].done()
+        assert anything.result() == ("All players are ready",)
+    asyncio.run(main())
+
+def test_cancelled_waiters_are_skipped():
+    async def main():
+        waiters = WaiterRegistry()
+        cancelled = waiters.expect("ready")
+        waiting = waiters.expect("ready")
+        cancelled.cancel()
+        assert waiters.dispatch("ready") == 1
+        assert waiting.done()
+    asyncio.run(main())
+
+def test_timeout_returns_empty_and_forgets_the_waiter():
+    async def main():
+        waiters = WaiterRegistry()
+        future = waiters.expect(MP_MAKE, "title")
+        assert await waiters.wait(MP_MAKE, future, "title", timeout=0.01) == tuple()
+        assert len(waiters) == 0
+        assert waiters.dispatch("Created the tournament match https://osu.ppy.sh/mp/4 title") == 0
+    asyncio.run(main())